@@ -0,0 +1,379 @@
+"""Local fake of the Nest endpoints used by badnest.
+
+Responses are built from the recorded bucket and camera payloads in
+fixtures.json, repeated for as many devices as the home is configured with.
+Bucket revisions are tracked like the real app_launch and /v5/put do, so
+clients that send known_bucket_versions only get back what changed. Like
+czfe, /v6/subscribe holds the call until a bucket it watches changes.
+
+Faults can be injected through /_bench/fail: the next requests to a path
+are delayed, answered with an error status, or both.
+"""
+import copy
+import json
+import multiprocessing
+import os
+import threading
+import time
+import urllib.request
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures.json")
+
+ROOM_NAMES = [
+    "Living Room",
+    "Kitchen",
+    "Hallway",
+    "Bedroom",
+    "Office",
+    "Basement",
+    "Garage",
+    "Dining Room",
+    "Nursery",
+    "Attic",
+]
+
+USER_ID = "0000000"
+STRUCTURE_ID = "00000000-0000-0000-0000-000000000000"
+# Seconds a subscribe call is held without changes before it returns empty
+SUBSCRIBE_HOLD = 60
+
+
+class FakeHome:
+    """Buckets and cameras of one home, with their current revisions."""
+
+    def __init__(
+        self, thermostats=1, protects=1, sensors=1, cameras=1, image_size=65536
+    ):
+        with open(FIXTURES) as f:
+            self.fixtures = json.load(f)
+        self.revision = 1
+        self.buckets = {}
+        self.versions = {}
+        self.image = b"\xff\xd8\xff\xe0" + bytes(max(0, image_size - 4))
+        self.requests = 0
+        self.paths = {}
+        self.faults = []
+        self.faults_served = 0
+        self._lock = threading.Lock()
+        # Notified whenever a bucket revision moves
+        self._changed = threading.Condition(self._lock)
+
+        rooms = max(1, min(len(ROOM_NAMES), thermostats + protects + sensors))
+        wheres = [
+            {"where_id": f"where-{i}", "name": ROOM_NAMES[i]} for i in range(rooms)
+        ]
+        self._set(f"where.{STRUCTURE_ID}", {"wheres": wheres})
+        for kind, prefix, count in (
+            ("device", "T", thermostats),
+            ("topaz", "P", protects),
+            ("kryptonite", "K", sensors),
+        ):
+            for i in range(count):
+                value = copy.deepcopy(self.fixtures[kind])
+                value["where_id"] = f"where-{i % rooms}"
+                self._set(f"{kind}.{prefix}{i:05d}", value)
+                if kind == "device":
+                    self._set(
+                        f"shared.{prefix}{i:05d}",
+                        copy.deepcopy(self.fixtures["shared"]),
+                    )
+        self.cameras = []
+        for i in range(cameras):
+            camera = copy.deepcopy(self.fixtures["camera"])
+            camera["uuid"] = f"C{i:031d}"
+            camera["name"] = camera["title"] = f"Camera {i}"
+            camera["where_id"] = f"where-{i % rooms}"
+            self.cameras.append(camera)
+
+    def _set(self, object_key, value):
+        self.buckets[object_key] = value
+        self.versions[object_key] = self.revision
+
+    def change(self, count):
+        """Move the current temperature of the first count thermostats."""
+        with self._lock:
+            self.revision += 1
+            shared = sorted(key for key in self.buckets if key.startswith("shared."))
+            for object_key in shared[:count]:
+                value = self.buckets[object_key]
+                value["current_temperature"] = round(
+                    18 + (value["current_temperature"] + 0.1 - 18) % 8, 2
+                )
+                self.versions[object_key] = self.revision
+            self._changed.notify_all()
+
+    def bucket(self, object_key):
+        return {
+            "object_key": object_key,
+            "object_revision": self.versions[object_key],
+            "object_timestamp": self.versions[object_key],
+            "value": self.buckets[object_key],
+        }
+
+    def app_launch(self, base, body):
+        bucket_types = body.get("known_bucket_types", [])
+        known = {
+            version["object_key"]: version["object_revision"]
+            for version in body.get("known_bucket_versions", [])
+        }
+        if bucket_types == ["buckets"]:
+            updated = [
+                {
+                    "object_key": f"buckets.{USER_ID}",
+                    "object_revision": 1,
+                    "object_timestamp": 1,
+                    "value": {
+                        "buckets": [
+                            key
+                            for key in self.buckets
+                            if key.split(".")[0] in ("device", "topaz", "kryptonite")
+                        ]
+                    },
+                }
+            ]
+        else:
+            with self._lock:
+                updated = [
+                    self.bucket(object_key)
+                    for object_key in self.buckets
+                    if object_key.split(".")[0] in bucket_types
+                    and known.get(object_key) != self.versions[object_key]
+                ]
+        return {
+            "updated_buckets": updated,
+            "service_urls": {"urls": {"czfe_url": base}},
+            "weave_service_urls": {},
+        }
+
+    def put(self, body):
+        with self._lock:
+            self.revision += 1
+            objects = []
+            for obj in body.get("objects", []):
+                self.buckets[obj["object_key"]].update(obj["value"])
+                self.versions[obj["object_key"]] = self.revision
+                objects.append(self.bucket(obj["object_key"]))
+            self._changed.notify_all()
+        return {"objects": objects}
+
+    def fail(self, path="", status=503, count=1, delay=0):
+        """Fail the next count requests whose path contains path.
+
+        Each is answered with status after delay seconds; a status of None
+        only delays the normal response. A count of None fails every request
+        until recover() is called.
+        """
+        with self._lock:
+            self.faults.append(
+                {"path": path, "status": status, "count": count, "delay": delay}
+            )
+
+    def recover(self):
+        """Drop all injected faults."""
+        with self._lock:
+            self.faults.clear()
+
+    def take_fault(self, path):
+        """Return the fault the request for path runs into, if any."""
+        with self._lock:
+            for fault in self.faults:
+                if fault["path"] in path:
+                    break
+            else:
+                return None
+            if fault["count"] is not None:
+                fault["count"] -= 1
+                if not fault["count"]:
+                    self.faults.remove(fault)
+            self.faults_served += 1
+            return fault
+
+    def subscribe(self, body, hold=SUBSCRIBE_HOLD):
+        """Wait until a watched bucket changes and return the changed ones."""
+        known = {
+            version["object_key"]: version["object_revision"]
+            for version in body.get("objects", [])
+        }
+
+        def changed():
+            return [
+                self.bucket(object_key)
+                for object_key, revision in known.items()
+                if self.versions.get(object_key, revision) != revision
+            ]
+
+        with self._changed:
+            return {"objects": self._changed.wait_for(changed, hold)}
+
+
+def _handler(home):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Send headers and body in one segment, so that latencies aren't
+        # dominated by Nagle's algorithm meeting delayed ACKs.
+        wbufsize = 1 << 16
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            self._respond()
+
+        def do_POST(self):
+            self._respond()
+
+        def _send(self, status, body, content_type="application/json"):
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _respond(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            url = urlparse(self.path)
+            path = url.path
+            body = {}
+            if raw and self.headers.get("Content-Type", "").startswith(
+                "application/json"
+            ):
+                body = json.loads(raw)
+
+            if path == "/_bench/stats":
+                return self._send(
+                    200,
+                    {
+                        "requests": home.requests,
+                        "paths": home.paths,
+                        "faults": home.faults_served,
+                    },
+                )
+            if path == "/_bench/change":
+                home.change(body["count"])
+                return self._send(200, {"revision": home.revision})
+            if path == "/_bench/fail":
+                home.fail(**body)
+                return self._send(200, {"faults": home.faults})
+            if path == "/_bench/recover":
+                home.recover()
+                return self._send(200, {"faults": home.faults})
+            with home._lock:
+                home.requests += 1
+                home.paths[path] = home.paths.get(path, 0) + 1
+
+            fault = home.take_fault(path)
+            if fault is not None:
+                time.sleep(fault["delay"])
+                if fault["status"] is not None:
+                    return self._send(fault["status"], {"error": "injected fault"})
+
+            if path == "/issue_token":
+                return self._send(200, home.fixtures["issue_token"])
+            if path == "/v1/issue_jwt":
+                return self._send(200, home.fixtures["issue_jwt"])
+            if path.endswith("/app_launch"):
+                return self._send(200, home.app_launch(self.server.base, body))
+            if path == "/v5/put":
+                return self._send(200, home.put(body))
+            if path == "/v6/subscribe":
+                return self._send(200, home.subscribe(body))
+            if path.endswith("get_owned_and_member_of_with_properties"):
+                return self._send(200, {"items": home.cameras})
+            if path.startswith("/dropcam/api/cameras/"):
+                uuid = path.rsplit("/", 1)[1]
+                return self._send(
+                    200, [camera for camera in home.cameras if camera["uuid"] == uuid]
+                )
+            if path == "/api/dropcams.set_properties":
+                return self._send(200, {"items": home.cameras[:1]})
+            if path == "/get_image":
+                if parse_qs(url.query).get("uuid"):
+                    return self._send(200, home.image, "image/jpeg")
+            return self._send(404, {"error": path})
+
+    return Handler
+
+
+def _serve(home_options, connection):
+    home = FakeHome(**home_options)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(home))
+    server.daemon_threads = True
+    server.base = f"http://127.0.0.1:{server.server_port}"
+    connection.send(server.base)
+    server.serve_forever()
+
+
+class FakeNestServer:
+    """Serve a FakeHome over HTTP on a free local port.
+
+    The server runs in a child process, so that neither its CPU time nor its
+    memory shows up in what the benchmarks measure. It is controlled through
+    the /_bench/ endpoints, which are not counted as requests.
+    """
+
+    def __init__(self, **home_options):
+        self._home_options = home_options
+        self._process = None
+        self.base = None
+
+    def start(self):
+        parent, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(self._home_options, child), daemon=True
+        )
+        self._process.start()
+        self.base = parent.recv()
+        return self
+
+    def stop(self):
+        self._process.terminate()
+        self._process.join()
+
+    def _control(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(
+            f"{self.base}/_bench/{path}",
+            data=data,
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def stats(self):
+        """Return the number of requests served, in total and per path.
+
+        faults counts the requests that ran into an injected fault.
+        """
+        return self._control("stats")
+
+    def change(self, count):
+        """Change the current temperature of count thermostats."""
+        return self._control("change", {"count": count})
+
+    def fail(self, path="", status=503, count=1, delay=0):
+        """Inject a fault, see FakeHome.fail()."""
+        return self._control(
+            "fail", {"path": path, "status": status, "count": count, "delay": delay}
+        )
+
+    def recover(self):
+        """Drop all injected faults."""
+        return self._control("recover", {})
+
+    def patch(self, api_module):
+        """Point the badnest.api module's URLs at this server."""
+        api_module.API_URL = self.base
+        api_module.CAMERA_WEBAPI_BASE = self.base
+        api_module.NEXUS_URL = self.base
+        api_module.URL_JWT = f"{self.base}/v1/issue_jwt"
+
+    @property
+    def issue_token(self):
+        return f"{self.base}/issue_token"
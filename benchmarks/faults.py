@@ -0,0 +1,196 @@
+"""Run AsyncNestAPI against the fake Nest server while it injects faults.
+
+Each scenario injects faults into the fake server's app_launch endpoint,
+polls once or more with AsyncNestAPI.update() and checks how the client
+coped:
+
+- transient: two 503s in a row, which the retries ride out
+- slow: one response held back for a while
+- outage: every call fails, until the circuit breaker stops sending any
+- recovery: the faults are gone, the trial call after the reset timeout
+  closes the circuit again
+- relogin: a 401, answered by logging in again and retrying the call
+
+Retry backoffs and the circuit reset timeout are scaled down so the run takes
+a few seconds, and logins aren't rate limited. Exits with status 1 if any
+scenario didn't go as expected:
+
+    python benchmarks/faults.py
+"""
+import argparse
+import asyncio
+import logging
+import sys
+
+from time import perf_counter
+
+import aiohttp
+
+from fake_nest import FakeNestServer
+from run import load_api
+
+APP_LAUNCH = "/app_launch"
+
+
+async def poll(nest, server, times=1):
+    """Poll times and return whether the last poll saw the server's change."""
+    sn = nest.thermostats[0]
+    server.change(1)
+    before = nest.device_data[sn].current_temperature
+    for _ in range(times):
+        nest._last_refresh.clear()
+        await nest.update()
+    return nest.device_data[sn].current_temperature != before
+
+
+async def scenario(name, nest, server, expect, inject, times=1):
+    """Run one scenario and return its row of results."""
+    inject()
+    stats = server.stats()
+    started = perf_counter()
+    updated = await poll(nest, server, times)
+    elapsed = perf_counter() - started
+    after = server.stats()
+    breaker = nest._breakers["app_launch"]
+    result = {
+        "scenario": name,
+        "updated": updated,
+        "requests": after["requests"] - stats["requests"],
+        "faults": after["faults"] - stats["faults"],
+        "elapsed": elapsed,
+        "circuit": "open" if breaker.is_open else "closed",
+    }
+    result["ok"] = all(result[key] == value for key, value in expect.items())
+    return result
+
+
+async def run_scenarios(api, server, args):
+    attempts = api.RETRY_POLICIES["app_launch"][0]
+    threshold = api.CIRCUIT_FAILURE_THRESHOLD
+    results = []
+    async with aiohttp.ClientSession() as session:
+        nest = api.AsyncNestAPI(session, None, None, server.issue_token, "cookie", "us")
+        await nest.async_setup()
+        try:
+            results.append(
+                await scenario(
+                    "transient",
+                    nest,
+                    server,
+                    {"updated": True, "requests": 3, "circuit": "closed"},
+                    lambda: server.fail(APP_LAUNCH, 503, count=2),
+                )
+            )
+            results.append(
+                await scenario(
+                    "slow",
+                    nest,
+                    server,
+                    {"updated": True, "requests": 1, "circuit": "closed"},
+                    lambda: server.fail(
+                        APP_LAUNCH, None, count=1, delay=args.slow_delay
+                    ),
+                )
+            )
+            # Calls made once the circuit is open don't reach the server
+            results.append(
+                await scenario(
+                    "outage",
+                    nest,
+                    server,
+                    {
+                        "updated": False,
+                        "requests": threshold * attempts,
+                        "circuit": "open",
+                    },
+                    lambda: server.fail(APP_LAUNCH, 503, count=None),
+                    times=threshold + 2,
+                )
+            )
+            server.recover()
+            await asyncio.sleep(args.reset_timeout)
+            results.append(
+                await scenario(
+                    "recovery",
+                    nest,
+                    server,
+                    {"updated": True, "requests": 1, "circuit": "closed"},
+                    lambda: None,
+                )
+            )
+            # The retried call follows issue_token and issue_jwt
+            results.append(
+                await scenario(
+                    "relogin",
+                    nest,
+                    server,
+                    {"updated": True, "requests": 4, "circuit": "closed"},
+                    lambda: server.fail(APP_LAUNCH, 401, count=1),
+                )
+            )
+        finally:
+            nest._token_refresh.cancel()
+    return results
+
+
+def print_results(results):
+    header = ["scenario", "updated", "requests", "faults", "ms", "circuit", "ok"]
+    rows = [
+        [
+            result["scenario"],
+            "yes" if result["updated"] else "no",
+            str(result["requests"]),
+            str(result["faults"]),
+            f"{result['elapsed'] * 1000:.1f}",
+            result["circuit"],
+            "ok" if result["ok"] else "FAILED",
+        ]
+        for result in results
+    ]
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--backoff-scale",
+        type=float,
+        default=0.05,
+        help="factor applied to the retry backoffs",
+    )
+    parser.add_argument(
+        "--reset-timeout", type=float, default=0.5, help="circuit reset seconds"
+    )
+    parser.add_argument(
+        "--slow-delay", type=float, default=0.5, help="seconds the slow reply takes"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    api = load_api()
+    for endpoint_class, (attempts, first, longest) in api.RETRY_POLICIES.items():
+        api.RETRY_POLICIES[endpoint_class] = (
+            attempts,
+            first * args.backoff_scale,
+            longest * args.backoff_scale,
+        )
+    api.CIRCUIT_RESET_TIMEOUT = args.reset_timeout
+    api.CIRCUIT_MAX_RESET_TIMEOUT = args.reset_timeout
+    # Otherwise the relogin is skipped so soon after the startup login
+    api.MIN_TIME_BETWEEN_LOGINS = 0
+
+    server = FakeNestServer(thermostats=1, protects=1, sensors=1, cameras=1).start()
+    server.patch(api)
+    try:
+        results = asyncio.run(run_scenarios(api, server, args))
+    finally:
+        server.stop()
+    print_results(results)
+    if not all(result["ok"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""Offline benchmarks for badnest's Nest API client.
+
+Runs AsyncNestAPI against the local fake Nest server in fake_nest.py, for
+homes of the given sizes, and reports:
+
+- startup: time to log in, discover devices and load them
+- update: latency of one AsyncNestAPI.update() poll
+- requests: HTTP requests sent per poll cycle
+- snapshot: latency of one AsyncNestAPI.camera_get_image() download from
+  the fake nexus
+- push: time from a change on the server until the subscription has applied
+  it and notified the update listeners
+- decode/apply: CPU time to decode a full app_launch response with the
+  codec AsyncNestAPI uses and to apply its buckets to device_data
+- json/orjson: CPU time of each JSON codec to decode that response and to
+  encode it again; with --payload, of a recorded app_launch response instead
+- response: size of that response
+- stream: the same response decoded and applied chunk by chunk, as update()
+  does from STREAM_MIN_SIZE bytes on, with its CPU time, peak memory and time
+  until the first device was updated, against decoding it whole with the
+  codec first, as update() does below that size
+- build: time and memory taken to build one request, averaged over the
+  app_launch, /v5/put, camera and snapshot requests
+- memory: memory allocated by an AsyncNestAPI holding the home
+
+A size of N means N thermostats, Protects, temperature sensors and cameras.
+Save a run with --json and compare a later one against it with --baseline:
+
+    python benchmarks/run.py --sizes 1 10 50 200 --json before.json
+    python benchmarks/run.py --sizes 1 10 50 200 --baseline before.json
+"""
+import argparse
+import asyncio
+import gc
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import statistics
+import sys
+import tracemalloc
+
+from time import perf_counter, process_time
+
+import aiohttp
+
+from fake_nest import FakeNestServer
+
+COMPONENT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "custom_components",
+    "badnest",
+)
+
+COLUMNS = [
+    ("startup", "startup ms", 1000),
+    ("update_p50", "update p50 ms", 1000),
+    ("update_p95", "update p95 ms", 1000),
+    ("requests_per_cycle", "requests/cycle", 1),
+    ("snapshot_p50", "snapshot p50 ms", 1000),
+    ("push_p50", "push p50 ms", 1000),
+    ("decode_cpu", "decode cpu ms", 1000),
+    ("apply_cpu", "apply cpu ms", 1000),
+    ("json_decode", "json decode ms", 1000),
+    ("orjson_decode", "orjson decode ms", 1000),
+    ("json_encode", "json encode ms", 1000),
+    ("orjson_encode", "orjson encode ms", 1000),
+    ("response_size", "response KiB", 1 / 1024),
+    ("stream_cpu", "stream cpu ms", 1000),
+    ("buffered_first", "buffered first ms", 1000),
+    ("stream_first", "stream first ms", 1000),
+    ("buffered_peak", "buffered peak KiB", 1 / 1024),
+    ("stream_peak", "stream peak KiB", 1 / 1024),
+    ("build_time", "build us", 1000000),
+    ("build_memory", "build bytes", 1),
+    ("memory", "memory KiB", 1 / 1024),
+]
+
+
+def load_api():
+    """Import badnest.api without the Home Assistant integration setup."""
+    spec = importlib.util.spec_from_file_location(
+        "badnest",
+        os.path.join(COMPONENT, "__init__.py"),
+        submodule_search_locations=[COMPONENT],
+    )
+    sys.modules["badnest"] = importlib.util.module_from_spec(spec)
+    return importlib.import_module("badnest.api")
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def bench_client(api, server, args, result):
+    async with aiohttp.ClientSession() as session:
+        nest = api.AsyncNestAPI(session, None, None, server.issue_token, "cookie", "us")
+        started = perf_counter()
+        await nest.async_setup()
+        result["startup"] = perf_counter() - started
+
+        latencies = []
+        requests_before = server.stats()["requests"]
+        for _ in range(args.cycles):
+            server.change(args.changes)
+            nest._last_refresh.clear()
+            started = perf_counter()
+            await nest.update()
+            latencies.append(perf_counter() - started)
+        requests_sent = server.stats()["requests"] - requests_before
+        result["requests_per_cycle"] = requests_sent / args.cycles
+        result["update_p50"] = statistics.median(latencies)
+        result["update_p95"] = percentile(latencies, 0.95)
+        await bench_snapshot(nest, args, result)
+        await bench_push(nest, server, args, result)
+
+        # A full app_launch, as sent on startup or after a room was renamed
+        async with session.post(
+            f"{server.base}/api/0.1/user/{nest._user_id}/app_launch",
+            json={
+                "known_bucket_types": ["where"] + api.KNOWN_BUCKET_TYPES,
+                "known_bucket_versions": [],
+            },
+        ) as r:
+            raw = await r.read()
+        nest._token_refresh.cancel()
+    decode = apply = 0
+    for _ in range(args.repeat):
+        started = process_time()
+        r = nest.codec.loads(raw)
+        decode += process_time() - started
+        nest._bucket_versions.clear()
+        started = process_time()
+        nest._apply_buckets(r["updated_buckets"])
+        apply += process_time() - started
+    result["decode_cpu"] = decode / args.repeat
+    result["apply_cpu"] = apply / args.repeat
+    bench_codecs(api, args.payload or raw, args, result)
+    bench_stream(api, nest, raw, args, result)
+    bench_build(nest, args, result)
+
+
+async def bench_snapshot(nest, args, result):
+    camera = nest.cameras[0]
+    latencies = []
+    for now in range(args.cycles):
+        started = perf_counter()
+        if not await nest.camera_get_image(camera, now):
+            raise RuntimeError("snapshot download failed")
+        latencies.append(perf_counter() - started)
+    result["snapshot_p50"] = statistics.median(latencies)
+
+
+async def bench_push(nest, server, args, result):
+    loop = asyncio.get_running_loop()
+    notified = asyncio.Event()
+    remove_listener = nest.add_update_listener(notified.set)
+    nest.start_subscription()
+    # Let the first subscribe call reach the server before changing anything
+    await asyncio.sleep(0.1)
+    latencies = []
+    for _ in range(args.cycles):
+        notified.clear()
+        started = perf_counter()
+        await loop.run_in_executor(None, server.change, args.changes)
+        await notified.wait()
+        latencies.append(perf_counter() - started)
+        # The subscriber sends its next call once the listeners are notified
+        await asyncio.sleep(0.01)
+    nest.stop_subscription()
+    remove_listener()
+    result["push_p50"] = statistics.median(latencies)
+
+
+def bench_codecs(api, raw, args, result):
+    codec = importlib.import_module("badnest.codec")
+    codecs = [codec.StdlibCodec]
+    if codec.orjson is not None:
+        codecs.append(codec.OrjsonCodec)
+    for json_codec in codecs:
+        decode = encode = 0
+        for _ in range(args.repeat):
+            started = process_time()
+            value = json_codec.loads(raw)
+            decode += process_time() - started
+            started = process_time()
+            json_codec.dumps(value)
+            encode += process_time() - started
+        result[f"{json_codec.name}_decode"] = decode / args.repeat
+        result[f"{json_codec.name}_encode"] = encode / args.repeat
+
+
+def first_bucket_timer(nest):
+    """Record when _process_bucket() first runs, on the nest instance."""
+    first = []
+    process_bucket = nest._process_bucket
+
+    def timed(bucket):
+        if not first:
+            first.append(perf_counter())
+        process_bucket(bucket)
+
+    nest._process_bucket = timed
+    return first
+
+
+def apply_buffered(api, nest, raw):
+    stream = api.BucketStream(nest, ["where"] + api.KNOWN_BUCKET_TYPES)
+    nest._add_buckets(raw, stream)
+    stream.close()
+
+
+def apply_streamed(api, nest, raw):
+    stream = api.BucketStream(nest, ["where"] + api.KNOWN_BUCKET_TYPES)
+    decoder = api.ArrayItemDecoder("updated_buckets")
+    for start in range(0, len(raw), api.STREAM_CHUNK_SIZE):
+        for bucket in decoder.feed(raw[start : start + api.STREAM_CHUNK_SIZE]):
+            stream.add(bucket)
+    decoder.close()
+    stream.close()
+
+
+def bench_stream(api, nest, raw, args, result):
+    result["response_size"] = len(raw)
+    cpu = 0
+    for _ in range(args.repeat):
+        nest._bucket_versions.clear()
+        started = process_time()
+        apply_streamed(api, nest, raw)
+        cpu += process_time() - started
+    result["stream_cpu"] = cpu / args.repeat
+
+    first = first_bucket_timer(nest)
+    for name, apply_response in (
+        ("buffered", apply_buffered),
+        ("stream", apply_streamed),
+    ):
+        firsts = []
+        for _ in range(args.repeat):
+            first.clear()
+            started = perf_counter()
+            apply_response(api, nest, raw)
+            firsts.append(first[0] - started)
+        result[f"{name}_first"] = statistics.median(firsts)
+
+        gc.collect()
+        tracemalloc.start()
+        apply_response(api, nest, raw)
+        result[f"{name}_peak"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    del nest._process_bucket
+
+
+def build_requests(nest):
+    """Build one request of each kind a poll or a dashboard sends."""
+    camera = nest.cameras[0]
+    return [
+        nest._app_launch_request(["device", "shared"]),
+        nest._put_request(
+            {f"shared.{nest.thermostats[0]}": {"target_temperature": 21}}
+        ),
+        nest._camera_request(camera),
+        nest._camera_image_request(camera, 0, 640),
+    ]
+
+
+def bench_build(nest, args, result):
+    built = 0
+    started = perf_counter()
+    for _ in range(args.repeat * 100):
+        built += len(build_requests(nest))
+    result["build_time"] = (perf_counter() - started) / built
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build_requests(nest) for _ in range(args.repeat * 10)]
+    result["build_memory"] = (tracemalloc.get_traced_memory()[0] - before) / (
+        len(kept) * len(kept[0])
+    )
+    tracemalloc.stop()
+
+
+async def bench_memory(api, server, result):
+    async with aiohttp.ClientSession() as session:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        nest = api.AsyncNestAPI(session, None, None, server.issue_token, "cookie", "us")
+        await nest.async_setup()
+        gc.collect()
+        result["memory"] = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        nest._token_refresh.cancel()
+
+
+def run(api, size, args):
+    server = FakeNestServer(
+        thermostats=size if args.thermostats is None else args.thermostats,
+        protects=size if args.protects is None else args.protects,
+        sensors=size if args.sensors is None else args.sensors,
+        cameras=size if args.cameras is None else args.cameras,
+    ).start()
+    server.patch(api)
+    result = {"size": size}
+    try:
+        asyncio.run(bench_client(api, server, args, result))
+        asyncio.run(bench_memory(api, server, result))
+    finally:
+        server.stop()
+    return result
+
+
+def print_results(results, baseline=None):
+    header = ["size"] + [title for _, title, _ in COLUMNS]
+    rows = []
+    for result in results:
+        row = [str(result["size"])]
+        previous = (baseline or {}).get(str(result["size"]))
+        for key, _, scale in COLUMNS:
+            if key not in result:
+                # orjson isn't installed
+                row.append("-")
+                continue
+            cell = f"{result[key] * scale:.2f}"
+            if previous and previous.get(key):
+                change = (result[key] - previous[key]) / previous[key] * 100
+                cell += f" ({change:+.0f}%)"
+            row.append(cell)
+        rows.append(row)
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--thermostats", type=int, help="override for every size")
+    parser.add_argument("--protects", type=int, help="override for every size")
+    parser.add_argument("--sensors", type=int, help="override for every size")
+    parser.add_argument("--cameras", type=int, help="override for every size")
+    parser.add_argument("--cycles", type=int, default=20, help="polls to time")
+    parser.add_argument(
+        "--changes", type=int, default=1, help="thermostats changing per poll"
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="parses to time")
+    parser.add_argument(
+        "--payload", help="recorded app_launch response to time the codecs on"
+    )
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare with results saved by --json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    if args.payload:
+        with open(args.payload, "rb") as f:
+            args.payload = f.read()
+    api = load_api()
+    results = [run(api, size, args) for size in args.sizes]
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {str(result["size"]): result for result in json.load(f)}
+    print_results(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
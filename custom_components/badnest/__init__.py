@@ -1,8 +1,18 @@
 """The example integration."""
+from datetime import timedelta
+import asyncio
+
 import voluptuous as vol
+from aiohttp import web
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.const import CONF_NAME, EVENT_HOMEASSISTANT_STOP
 from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.aiohttp_client import async_create_clientsession
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
+from homeassistant.util import slugify
 
-from .api import NestAPI
+from .api import AsyncNestAPI, REFRESH_INTERVALS, SNAPSHOT_INTERVAL, STREAM_INTERVAL
 from .const import (
     DOMAIN,
     CONF_ISSUE_TOKEN,
@@ -10,44 +20,170 @@ from .const import (
     CONF_USER_ID,
     CONF_ACCESS_TOKEN,
     CONF_REGION,
+    CONF_SUBSCRIBE,
+    CONF_SNAPSHOT_INTERVAL,
+    CONF_STREAM_INTERVAL,
+    CONF_METRICS,
+    CONF_REFRESH_INTERVALS,
+    CONF_ACCOUNTS,
+    STORAGE_KEY,
+    STORAGE_VERSION,
 )
+from .metrics import prometheus
 
-CONFIG_SCHEMA = vol.Schema(
+# Seconds between refreshes, per refresh tier
+REFRESH_INTERVALS_SCHEMA = vol.Schema(
+    {vol.Optional(tier): cv.positive_int for tier in REFRESH_INTERVALS}
+)
+
+
+def has_unique_account_names(accounts):
+    """Validate that no two accounts share a name."""
+    names = [account.get(CONF_NAME) for account in accounts]
+    if len(set(names)) != len(names):
+        raise vol.Invalid("every account needs a name of its own")
+    return accounts
+
+
+ACCOUNT_SCHEMA = vol.All(
     {
-        DOMAIN: vol.All(
-            {
-                vol.Required(CONF_USER_ID, default=""): cv.string,
-                vol.Required(CONF_ACCESS_TOKEN, default=""): cv.string,
-                vol.Optional(CONF_REGION, default="us"): cv.string,
-            },
-            {
-                vol.Required(CONF_ISSUE_TOKEN, default=""): cv.string,
-                vol.Required(CONF_COOKIE, default=""): cv.string,
-                vol.Optional(CONF_REGION, default="us"): cv.string,
-            },
-        )
+        vol.Optional(CONF_NAME): cv.string,
+        vol.Required(CONF_USER_ID, default=""): cv.string,
+        vol.Required(CONF_ACCESS_TOKEN, default=""): cv.string,
+        vol.Optional(CONF_REGION, default="us"): cv.string,
+        vol.Optional(CONF_SUBSCRIBE, default=False): cv.boolean,
+        vol.Optional(
+            CONF_SNAPSHOT_INTERVAL, default=SNAPSHOT_INTERVAL
+        ): cv.positive_int,
+        vol.Optional(CONF_STREAM_INTERVAL, default=STREAM_INTERVAL): cv.positive_int,
+        vol.Optional(CONF_METRICS, default=False): cv.boolean,
+        vol.Optional(CONF_REFRESH_INTERVALS, default={}): REFRESH_INTERVALS_SCHEMA,
     },
+    {
+        vol.Optional(CONF_NAME): cv.string,
+        vol.Required(CONF_ISSUE_TOKEN, default=""): cv.string,
+        vol.Required(CONF_COOKIE, default=""): cv.string,
+        vol.Optional(CONF_REGION, default="us"): cv.string,
+        vol.Optional(CONF_SUBSCRIBE, default=False): cv.boolean,
+        vol.Optional(
+            CONF_SNAPSHOT_INTERVAL, default=SNAPSHOT_INTERVAL
+        ): cv.positive_int,
+        vol.Optional(CONF_STREAM_INTERVAL, default=STREAM_INTERVAL): cv.positive_int,
+        vol.Optional(CONF_METRICS, default=False): cv.boolean,
+        vol.Optional(CONF_REFRESH_INTERVALS, default={}): REFRESH_INTERVALS_SCHEMA,
+    },
+)
+
+# One account, or a list of them
+CONFIG_SCHEMA = vol.Schema(
+    {DOMAIN: vol.All(cv.ensure_list, [ACCOUNT_SCHEMA], has_unique_account_names)},
     extra=vol.ALLOW_EXTRA,
 )
 
 
-def setup(hass, config):
+async def async_setup(hass, config):
     """Set up the badnest component."""
-    if config.get(DOMAIN) is not None:
-        user_id = config[DOMAIN].get(CONF_USER_ID)
-        access_token = config[DOMAIN].get(CONF_ACCESS_TOKEN)
-        issue_token = config[DOMAIN].get(CONF_ISSUE_TOKEN)
-        cookie = config[DOMAIN].get(CONF_COOKIE)
-        region = config[DOMAIN].get(CONF_REGION)
+    # Account name, None for an unnamed account -> its API
+    accounts = {}
+    # Accounts whose requests are counted
+    metrics = {}
+    hass.data[DOMAIN] = {CONF_ACCOUNTS: accounts, CONF_METRICS: metrics}
+    for account_config in config.get(DOMAIN) or [{}]:
+        name = account_config.get(CONF_NAME)
+        accounts[name] = await async_setup_account(hass, account_config)
+        if account_config.get(CONF_METRICS):
+            metrics[name] = accounts[name]
+    if metrics:
+        hass.http.register_view(NestMetricsView(metrics))
+    return True
+
+
+async def async_setup_account(hass, account_config):
+    """Create the API of one Nest account and start loading its devices."""
+    name = account_config.get(CONF_NAME)
+    # Every account has its own session and cookies, all sessions share Home
+    # Assistant's connection pool.
+    api = AsyncNestAPI(
+        async_create_clientsession(hass),
+        account_config.get(CONF_USER_ID),
+        account_config.get(CONF_ACCESS_TOKEN),
+        account_config.get(CONF_ISSUE_TOKEN),
+        account_config.get(CONF_COOKIE),
+        account_config.get(CONF_REGION),
+        snapshot_interval=account_config.get(CONF_SNAPSHOT_INTERVAL, SNAPSHOT_INTERVAL),
+        refresh_intervals=account_config.get(CONF_REFRESH_INTERVALS),
+        stream_interval=account_config.get(CONF_STREAM_INTERVAL, STREAM_INTERVAL),
+    )
+
+    # Auth and devices from the last run let the platforms add their entities
+    # right away; either way platforms only wait for their own part of the
+    # data, so finish setup now and talk to Nest in the background.
+    store = Store(
+        hass,
+        STORAGE_VERSION,
+        STORAGE_KEY if name is None else f"{STORAGE_KEY}.{slugify(name)}",
+    )
+    if api.restore(await store.async_load()):
+        load = api.async_revalidate
     else:
-        email = None
-        password = None
-        issue_token = None
-        cookie = None
-        region = None
+        load = api.async_setup
 
-    hass.data[DOMAIN] = {
-        "api": NestAPI(user_id, access_token, issue_token, cookie, region,),
-    }
+    async def async_load_and_save():
+        if await load():
+            await store.async_save(api.snapshot())
 
-    return True
+    async def async_save_snapshot(event):
+        await store.async_save(api.snapshot())
+
+    hass.async_create_task(async_load_and_save())
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_save_snapshot)
+
+    if account_config.get(CONF_SUBSCRIBE):
+        api.start_subscription()
+        hass.bus.async_listen_once(
+            EVENT_HOMEASSISTANT_STOP, lambda event: api.stop_subscription()
+        )
+
+    # One timer for all of the account's platforms. Each poll only fetches
+    # the refresh tiers that are due.
+    async def async_poll(now):
+        polls = [api.update_cameras()]
+        # The subscriber keeps thermostats, sensors and Protects current
+        if not api.subscribed:
+            polls.append(api.update())
+        await asyncio.gather(*polls)
+
+    async_track_time_interval(hass, async_poll, timedelta(seconds=api.poll_interval))
+
+    return api
+
+
+async def async_setup_accounts(hass, async_setup_account):
+    """Run a platform's async_setup_account(account, api) for every account.
+
+    Accounts are set up side by side, so a slow one doesn't hold up the rest.
+    """
+    await asyncio.gather(
+        *(
+            async_setup_account(account, api)
+            for account, api in hass.data[DOMAIN][CONF_ACCOUNTS].items()
+        )
+    )
+
+
+class NestMetricsView(HomeAssistantView):
+    """Serve the Nest request metrics in the Prometheus text format."""
+
+    url = "/api/badnest/metrics"
+    name = "api:badnest:metrics"
+
+    def __init__(self, accounts):
+        """Initialize the view."""
+        self.accounts = accounts
+
+    async def get(self, request):
+        """Return the current metrics of every account."""
+        return web.Response(
+            text=prometheus({name: api.metrics for name, api in self.accounts.items()}),
+            content_type="text/plain",
+        )
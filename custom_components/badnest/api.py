@@ -1,12 +1,23 @@
+import asyncio
+import functools
 import logging
+import math
+import random
 import sys
-import requests
-import simplejson
+import aiohttp
 
-from time import sleep
+from time import monotonic, time
+from types import MappingProxyType
+
+from .camerafeed import CameraFeed
+from .codec import JSON_CODEC
+from .devices import CameraState, ProtectState, TemperatureSensorState, ThermostatState
+from .jsonstream import ArrayItemDecoder
+from .metrics import RequestMetrics
 
 API_URL = "https://home.nest.com"
 CAMERA_WEBAPI_BASE = "https://webapi.camera.home.nest.com"
+NEXUS_URL = "https://nexusapi-{region}1.camera.home.nest.com"
 USER_AGENT = (
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_5) "
     "AppleWebKit/537.36 (KHTML, like Gecko) "
@@ -29,33 +40,349 @@ KNOWN_BUCKET_TYPES = [
 
 REQUEST_TIMEOUT = 30
 
+# app_launch responses of at least STREAM_MIN_SIZE bytes, or of unknown size,
+# are decoded and applied in chunks of STREAM_CHUNK_SIZE bytes, so a big home's
+# response never has to be held in memory all at once. Smaller ones, such as
+# every poll's, are read whole: the codec decodes them much faster.
+STREAM_MIN_SIZE = 1048576
+STREAM_CHUNK_SIZE = 16384
+
+# Lifetime requested for the Nest JWT, and how long before it runs out a
+# background login replaces it.
+JWT_LIFETIME = 3600
+JWT_REFRESH_MARGIN = 300
+# Callers that hit an expired token right after another caller logged in
+# reuse that login instead of running their own.
+MIN_TIME_BETWEEN_LOGINS = 30
+
+# Entities polling within this many seconds of the last refresh share its
+# result instead of triggering another app_launch round trip.
+MIN_TIME_BETWEEN_UPDATES = 5
+
+# Default seconds between two refreshes of each tier of data. Entities poll
+# often, but a poll only fetches the tiers that are due: thermostats change
+# quickly and Protects report smoke and CO alarms, temperature sensors and
+# cameras change rarely.
+REFRESH_INTERVALS = {"thermostats": 30, "protects": 30, "sensors": 300, "cameras": 300}
+# Bucket types app_launch returns for each tier; cameras have their own call
+REFRESH_TIER_BUCKETS = {
+    "thermostats": ["device", "shared"],
+    "protects": ["topaz"],
+    "sensors": ["kryptonite"],
+}
+
+# The czfe subscribe call is held open by the server until a watched bucket
+# changes, so it needs a much longer timeout than regular requests.
+SUBSCRIBE_TIMEOUT = 180
+SUBSCRIBE_RETRY_DELAY = 30
+# A reply without changes sooner than SUBSCRIBE_MIN_HOLD seconds means czfe
+# isn't holding the call. The next one then waits, starting at
+# SUBSCRIBE_MIN_DELAY seconds and doubling up to SUBSCRIBE_RETRY_DELAY.
+SUBSCRIBE_MIN_HOLD = 5
+SUBSCRIBE_MIN_DELAY = 1
+
+# Default minimum number of seconds between two snapshot downloads per camera.
+SNAPSHOT_INTERVAL = 30
+
+# Default number of seconds between two frames of a live camera stream. Every
+# frame is a nexus snapshot, fetched once however many viewers are watching.
+STREAM_INTERVAL = 2
+
+# AsyncNestAPI holds thermostat writes this many seconds so that writes from
+# scenes and automations touching several settings go out in one /v5/put.
+WRITE_BATCH_DELAY = 0.1
+
+# Scaled snapshots are requested in steps of this many pixels; anything at
+# least SNAPSHOT_MAX_WIDTH wide gets the full-resolution image.
+SNAPSHOT_WIDTH_STEP = 160
+SNAPSHOT_MAX_WIDTH = 1920
+
+# Retry policy per endpoint class: (attempts, first backoff, longest backoff).
+# Backoffs double per attempt and are jittered so that several failing callers
+# don't retry in lockstep.
+RETRY_POLICIES = {
+    "app_launch": (3, 1, 8),
+    "put": (3, 0.5, 4),
+    "camera": (2, 1, 4),
+    "nexus": (1, 0, 0),
+}
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Endpoint class of each logical endpoint; endpoints not listed are not retried
+ENDPOINT_CLASSES = {
+    "app_launch": "app_launch",
+    "v5_put": "put",
+    "cameras": "camera",
+    "dropcam_camera": "camera",
+    "set_properties": "camera",
+    "get_image": "nexus",
+}
+
+# An endpoint class failing this many calls in a row is not called again for
+# CIRCUIT_RESET_TIMEOUT seconds, doubling up to CIRCUIT_MAX_RESET_TIMEOUT while
+# the trial calls made after each pause keep failing.
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_RESET_TIMEOUT = 60
+CIRCUIT_MAX_RESET_TIMEOUT = 600
+
+# Bucket fields copied into device_data as they are, per bucket type, as
+# device_data key -> bucket field. Fields that need converting are set by the
+# bucket type's _parse_<type>() method, which runs after these are copied.
+BUCKET_FIELDS = {
+    "shared": {
+        "current_temperature": "current_temperature",
+        "target_temperature": "target_temperature",
+        "hvac_ac_state": "hvac_ac_state",
+        "hvac_heater_state": "hvac_heater_state",
+        "target_temperature_high": "target_temperature_high",
+        "target_temperature_low": "target_temperature_low",
+        "can_heat": "can_heat",
+        "can_cool": "can_cool",
+        "mode": "target_temperature_type",
+    },
+    "device": {
+        "has_fan": "has_fan",
+        "fan": "fan_timer_timeout",
+        "current_humidity": "current_humidity",
+        "target_humidity": "target_humidity",
+        "target_humidity_enabled": "target_humidity_enabled",
+    },
+    "kryptonite": {
+        "temperature": "current_temperature",
+        "battery_level": "battery_level",
+    },
+}
+
+DEFAULT_HEADERS = {"Referer": "https://home.nest.com/", "User-Agent": USER_AGENT}
+
 _LOGGER = logging.getLogger(__name__)
 # _LOGGER.setLevel(logging.DEBUG)
 
+# Returned by _send_nest_api() for failures worth retrying
+_RETRY = object()
+
+
+class CircuitBreaker:
+    """Track consecutive failures of one endpoint class.
+
+    Once CIRCUIT_FAILURE_THRESHOLD calls in a row failed the circuit opens and
+    allow() refuses calls until the reset timeout has passed. Then a single
+    trial call is let through: success closes the circuit, failure opens it
+    again for twice as long.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._failures = 0
+        self._opened_at = None
+        self._reset_timeout = CIRCUIT_RESET_TIMEOUT
+        self._trial = False
+
+    @property
+    def is_open(self):
+        """Return True while calls are being refused."""
+        if self._opened_at is None:
+            return False
+        return self._trial or monotonic() - self._opened_at < self._reset_timeout
+
+    def allow(self):
+        """Return True if a call may go out now."""
+        if self.is_open:
+            return False
+        if self._opened_at is not None:
+            self._trial = True
+        return True
+
+    def release(self):
+        """Count a call that ended in an exception as neither kind of result.
+
+        A trial call that didn't finish lets the next call through instead.
+        """
+        self._trial = False
+
+    def record_success(self):
+        if self._opened_at is not None:
+            _LOGGER.warning(f"Nest {self.name} calls are working again")
+        self._failures = 0
+        self._opened_at = None
+        self._reset_timeout = CIRCUIT_RESET_TIMEOUT
+        self._trial = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._trial:
+            self._reset_timeout = min(
+                self._reset_timeout * 2, CIRCUIT_MAX_RESET_TIMEOUT
+            )
+        elif self._failures < CIRCUIT_FAILURE_THRESHOLD:
+            return
+        self._opened_at = monotonic()
+        self._trial = False
+        _LOGGER.warning(
+            f"Nest {self.name} calls failed {self._failures} times in a row, "
+            f"pausing them for {self._reset_timeout} seconds"
+        )
+
+
+class BucketStream:
+    """Apply the buckets of an app_launch response as they are decoded.
+
+    Room names have to be known before the devices named after them, so
+    while a where bucket that was asked for hasn't arrived yet, the other
+    buckets are held back until it does.
+
+    A bucket that fails to apply is logged and skipped. Its version isn't
+    recorded, so the next app_launch asks for it again.
+    """
+
+    def __init__(self, api, bucket_types):
+        self._api = api
+        self._waiting_for_rooms = "where" in bucket_types
+        self._held = []
+        self.rooms_changed = False
+
+    def add(self, bucket):
+        if bucket["object_key"].startswith("where."):
+            self._apply(bucket)
+            self.rooms_changed = True
+            self._waiting_for_rooms = False
+            self._release()
+        elif self._waiting_for_rooms:
+            self._held.append(bucket)
+        else:
+            self._apply(bucket)
+
+    def close(self):
+        """Apply the buckets still held back, as no room changed after all."""
+        self._waiting_for_rooms = False
+        self._release()
+
+    def _release(self):
+        for bucket in self._held:
+            self._apply(bucket)
+        self._held = []
+
+    def _apply(self, bucket):
+        # Not a failed request: the response itself was fine
+        try:
+            self._api._process_bucket(bucket)
+        except Exception:
+            _LOGGER.exception(f"Failed applying Nest bucket {bucket.get('object_key')}")
+
 
-class NestAPI:
-    def __init__(self, user_id, access_token, issue_token, cookie, region):
+class AsyncNestAPI:
+    """Nest web API client doing all I/O on the event loop through aiohttp.
+
+    Requests go through the aiohttp ClientSession handed in, so they share
+    its connection pool and keep-alive connections. Methods talking to Nest
+    are coroutines, or return one. Call async_setup() before use, the
+    constructor does no I/O.
+    """
+
+    # Encodes request bodies and decodes responses; StdlibCodec or OrjsonCodec
+    codec = JSON_CODEC
+
+    def __init__(
+        self,
+        session,
+        user_id,
+        access_token,
+        issue_token,
+        cookie,
+        region,
+        snapshot_interval=SNAPSHOT_INTERVAL,
+        refresh_intervals=None,
+        stream_interval=STREAM_INTERVAL,
+    ):
         self.device_data = {}
         self._wheres = {}
         self._user_id = user_id
         self._access_token = access_token
-        self._session = requests.Session()
-        self._session.headers.update(
-            {"Referer": "https://home.nest.com/", "User-Agent": USER_AGENT,}
-        )
         self._issue_token = issue_token
         self._cookie = cookie
         self._czfe_url = None
-        self._camera_url = f"https://nexusapi-{region}1.camera.home.nest.com"
+        self._camera_url = NEXUS_URL.format(region=region)
         self.cameras = []
         self.thermostats = []
         self.temperature_sensors = []
         self.protects = []
-        if self.login():
-            self._get_devices()
-            self.update()
-            for camera in self.cameras:
-                self.update_camera(camera)
+        # Refresh tier -> seconds between refreshes, and monotonic time of
+        # the last one
+        self._refresh_intervals = {**REFRESH_INTERVALS, **(refresh_intervals or {})}
+        self._last_refresh = {}
+        self._bucket_versions = {}
+        # tuple of bucket types -> encoded app_launch body, while the bucket
+        # versions it lists are current
+        self._app_launch_bodies = {}
+        # device id, or None for every device -> listeners
+        self._update_listeners = {}
+        # Devices changed since the listeners were last notified
+        self._changed_devices = set()
+        self._subscriber = None
+        self._token_expiry = None
+        self._token_refresh = None
+        self._snapshot_interval = snapshot_interval
+        # uuid -> (monotonic fetch time, image bytes)
+        self._camera_images = {}
+        self._breakers = {
+            endpoint: CircuitBreaker(endpoint) for endpoint in RETRY_POLICIES
+        }
+        self.metrics = RequestMetrics()
+        self._bucket_parsers = {
+            "where": self._parse_where,
+            "shared": self._parse_shared,
+            "device": self._parse_device,
+            "topaz": self._parse_topaz,
+            "kryptonite": self._parse_kryptonite,
+        }
+        self._session = session
+        self._update_lock = asyncio.Lock()
+        self._camera_update_lock = asyncio.Lock()
+        self._camera_image_fetches = {}
+        self._stream_interval = stream_interval
+        # device_id -> CameraFeed, kept once created and idle without viewers
+        self._camera_feeds = {}
+        # object_key -> (merged value, future), sent by _flush_writes()
+        self._pending_writes = {}
+        self._write_flush = None
+        self._login_lock = asyncio.Lock()
+        self._devices_ready = asyncio.Event()
+        self._cameras_ready = asyncio.Event()
+        self._build_request_templates()
+
+    async def async_setup(self):
+        """Log in, then load devices and cameras concurrently.
+
+        Thermostat/sensor/Protect data and camera data are loaded
+        independently, and async_wait_devices() and async_wait_cameras()
+        return as soon as their part is done, even when it failed.
+        """
+        try:
+            if not await self.login():
+                return False
+            await asyncio.gather(self._setup_devices(), self._setup_cameras())
+            return True
+        finally:
+            self._devices_ready.set()
+            self._cameras_ready.set()
+
+    async def _setup_devices(self):
+        try:
+            found, _ = await asyncio.gather(self._get_devices(), self._update_wheres())
+            if found:
+                async with self._update_lock:
+                    self._refreshed(REFRESH_TIER_BUCKETS)
+                    await self._update_devices()
+        finally:
+            self._devices_ready.set()
+
+    async def _setup_cameras(self):
+        try:
+            cameras = await self._get_cameras()
+            if cameras is not False:
+                self.cameras = cameras
+                self._refreshed(["cameras"])
+        finally:
+            self._cameras_ready.set()
 
     def __getitem__(self, name):
         return getattr(self, name)
@@ -69,54 +396,111 @@ class NestAPI:
     def __contains__(self, name):
         return hasattr(self, name)
 
-    def _call_nest_api(
+    async def _call_nest_api(self, endpoint=None, **request):
+        endpoint_class = ENDPOINT_CLASSES.get(endpoint)
+        breaker = self._breakers.get(endpoint_class)
+        if breaker is None:
+            r = await self._send_nest_api(endpoint=endpoint, **request)
+            return False if r is _RETRY else r
+        if not breaker.allow():
+            _LOGGER.debug(f"Skipping Nest {endpoint} call, circuit is open")
+            return False
+        r = _RETRY
+        try:
+            for attempt in range(RETRY_POLICIES[endpoint_class][0]):
+                if attempt:
+                    await asyncio.sleep(self._retry_delay(endpoint_class, attempt))
+                r = await self._send_nest_api(endpoint=endpoint, **request)
+                if r is not _RETRY:
+                    break
+        except BaseException:
+            # Cancelled, or a bug on our side: says nothing about Nest
+            breaker.release()
+            raise
+        if r is _RETRY:
+            breaker.record_failure()
+            return False
+        breaker.record_success()
+        return r
+
+    def _retry_delay(self, endpoint_class, attempt):
+        """Jittered exponential backoff before the given retry attempt."""
+        _, first, longest = RETRY_POLICIES[endpoint_class]
+        return random.uniform(0, min(longest, first * 2 ** (attempt - 1)))
+
+    async def _send_nest_api(
         self,
         method,
         url,
-        headers,
+        headers=None,
         json=None,
         params=None,
         data=None,
         is_retry=False,
         is_json=True,
+        timeout=REQUEST_TIMEOUT,
+        endpoint=None,
+        stream=None,
+        auth=None,
     ):
+        if params is not None:
+            # aiohttp only accepts str/int/float query values
+            params = {key: str(value) for key, value in params.items()}
+        if auth is not None:
+            # The prebuilt headers include DEFAULT_HEADERS already
+            headers = self._auth_headers[auth]
+        else:
+            headers = {**DEFAULT_HEADERS, **headers}
+        if json is not None:
+            data = self.codec.dumps(json)
+            if "Content-Type" not in headers:
+                headers = {**headers, "Content-Type": "application/json"}
+        started = monotonic()
         try:
-            if method == "get":
-                r = self._session.get(
-                    url=url,
-                    headers=headers,
-                    params=params,
-                    json=json,
-                    data=data,
-                    timeout=REQUEST_TIMEOUT,
-                )
-            elif method == "post":
-                r = self._session.post(
-                    url=url,
-                    headers=headers,
-                    params=params,
-                    json=json,
-                    data=data,
-                    timeout=REQUEST_TIMEOUT,
+            async with self._session.request(
+                method,
+                url,
+                headers=headers,
+                params=params,
+                data=data,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+            ) as r:
+                status = r.status
+                if stream is not None and status == 200:
+                    return await self._read_bucket_stream(r, stream, endpoint, started)
+                body = await r.read()
+                self.metrics.record_request(
+                    endpoint, status, monotonic() - started, len(body)
                 )
-            else:
-                _LOGGER.error("Unsupported Method: {}".format(method))
-        except requests.exceptions.RequestException as e:
+                if status == 200:
+                    try:
+                        if is_json:
+                            return self.codec.loads(body)
+                        return body
+                    except ValueError:
+                        _LOGGER.error(
+                            "API Response: JsonDecodeError: return code {} and returned text {}  for url {}".format(
+                                status, await r.text(), url
+                            )
+                        )
+                        return False
+                text = await r.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.metrics.record_request(endpoint, "error", monotonic() - started)
             _LOGGER.error(e)
             _LOGGER.error("Failed Calling: {}\nMethod: {}".format(url, method))
-        except KeyError:
+            return _RETRY
+
+        if status == 401:
             if is_retry:
                 _LOGGER.error(
-                    "KeyError Retry Failed Calling: {}\nMethod: {}".format(url, method)
+                    "401 Retry Failed Calling: {}\nMethod: {}".format(url, method)
                 )
             else:
-                _LOGGER.error(
-                    "KeyError Failed Calling: {}\nMethod: {}".format(url, method)
-                )
-                if self.login():
-                    if "Authorization" in headers:
-                        headers["Authorization"] = f"Basic {self._access_token}"
-                    return self._call_nest_api(
+                _LOGGER.error("401 Failed Calling: {}\nMethod: {}".format(url, method))
+                self.metrics.record_relogin(endpoint)
+                if await self.login():
+                    return await self._send_nest_api(
                         method,
                         url,
                         headers,
@@ -125,66 +509,94 @@ class NestAPI:
                         data=data,
                         is_retry=True,
                         is_json=is_json,
+                        timeout=timeout,
+                        auth=auth,
+                        endpoint=endpoint,
+                        stream=stream,
                     )
+        elif status in RETRY_STATUS_CODES:
+            _LOGGER.error("{} API Response for url {}".format(status, url))
+            return _RETRY
         else:
-            # Parse Json
-            if r.status_code == 200:
-                try:
-                    if is_json:
-                        api_response = r.json()
-                    else:
-                        api_response = r.content
-                except simplejson.errors.JSONDecodeError as e:
-                    _LOGGER.error(
-                        "API Response: JsonDecodeError: return code {} and returned text {}  for url {}".format(
-                            r.text, r.status_code, url
-                        )
-                    )
-                else:
-                    return api_response
-            elif r.status_code != 200 and r.status_code not in (502, 401):
-                _LOGGER.error(
-                    "Bad API Response: Information for further debugging: return code {} and returned text {} for url {}".format(
-                        r.status_code, r.text, url
-                    )
+            _LOGGER.error(
+                "Bad API Response: Information for further debugging: return code {} and returned text {} for url {}".format(
+                    status, text, url
                 )
-            elif r.status_code == 401:
-                if is_retry:
-                    _LOGGER.error(
-                        "401 Retry Failed Calling: {}\nMethod: {}".format(url, method)
-                    )
-                else:
-                    _LOGGER.error(
-                        "401 Failed Calling: {}\nMethod: {}".format(url, method)
-                    )
-                    if self.login():
-                        if "Authorization" in headers:
-                            headers["Authorization"] = f"Basic {self._access_token}"
-                        return self._call_nest_api(
-                            method,
-                            url,
-                            headers,
-                            json=json,
-                            params=params,
-                            data=data,
-                            is_retry=True,
-                            is_json=is_json,
-                        )
-            else:
-                _LOGGER.error("502 API Response for url {}".format(url))
+            )
         return False
 
-    def login(self):
-        status = False
-        if self._issue_token and self._cookie:
-            status = self._login_google(self._issue_token, self._cookie)
-            if not status:
-                _LOGGER.error("Login To Google Failes")
-        else:
-            _LOGGER.error("Issue Token and Cookie Not Set. Unable To Auth To Google")
-        return status
+    async def _read_bucket_stream(self, r, stream, endpoint, started):
+        size = 0
+        try:
+            if r.content_length is not None and r.content_length < STREAM_MIN_SIZE:
+                body = await r.read()
+                size = len(body)
+                self._add_buckets(body, stream)
+            else:
+                decoder = ArrayItemDecoder("updated_buckets")
+                async for chunk in r.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    size += len(chunk)
+                    for bucket in decoder.feed(chunk):
+                        stream.add(bucket)
+                decoder.close()
+        except ValueError as e:
+            self.metrics.record_request(endpoint, 200, monotonic() - started, size)
+            _LOGGER.error(f"API Response: JsonDecodeError: {e} for {r.url}")
+            return False
+        self.metrics.record_request(endpoint, 200, monotonic() - started, size)
+        return True
+
+    def _add_buckets(self, body, stream):
+        """Decode a whole response body with the codec into stream."""
+        for bucket in self.codec.loads(body).get("updated_buckets", []):
+            stream.add(bucket)
+
+    async def login(self):
+        """Log in, sharing one login between concurrent callers."""
+        async with self._login_lock:
+            if self._recently_logged_in():
+                return True
+            status = False
+            if self._issue_token and self._cookie:
+                status = await self._login_google(self._issue_token, self._cookie)
+                if not status:
+                    _LOGGER.error("Login To Google Failes")
+            else:
+                _LOGGER.error(
+                    "Issue Token and Cookie Not Set. Unable To Auth To Google"
+                )
+            return status
+
+    def _recently_logged_in(self):
+        if self._token_expiry is None:
+            return False
+        logged_in_at = self._token_expiry - JWT_LIFETIME
+        return monotonic() - logged_in_at < MIN_TIME_BETWEEN_LOGINS
+
+    def _token_refresh_delay(self):
+        """Seconds until the JWT should be replaced by a fresh login."""
+        return max(0, self._token_expiry - monotonic() - JWT_REFRESH_MARGIN)
 
-    def _login_google(self, issue_token, cookie):
+    def _schedule_token_refresh(self):
+        if self._token_refresh is not None:
+            self._token_refresh.cancel()
+        self._token_refresh = asyncio.get_event_loop().call_later(
+            self._token_refresh_delay(), lambda: asyncio.ensure_future(self.login())
+        )
+
+    async def _login_google(self, issue_token, cookie):
+        r = await self._call_nest_api(**self._issue_token_request(issue_token, cookie))
+        if not r:
+            _LOGGER.error("Failed Getting Access Token")
+            return False
+        r = await self._call_nest_api(**self._issue_jwt_request(r["access_token"]))
+        if not r:
+            _LOGGER.error("Failed Getting JWT")
+            return False
+        self._handle_jwt(r)
+        return True
+
+    def _issue_token_request(self, issue_token, cookie):
         headers = {
             "User-Agent": USER_AGENT,
             "Sec-Fetch-Mode": "cors",
@@ -192,94 +604,243 @@ class NestAPI:
             "Referer": "https://accounts.google.com/o/oauth2/iframe",
             "cookie": cookie,
         }
-        r = self._call_nest_api(method="get", url=issue_token, headers=headers)
-        if not r:
-            _LOGGER.error("Failed Getting Access Token")
-            return False
-        else:
-            access_token = r["access_token"]
-
-            headers = {
-                "User-Agent": USER_AGENT,
-                "Authorization": "Bearer " + access_token,
-                "x-goog-api-key": NEST_API_KEY,
-                "Referer": "https://home.nest.com",
-            }
-            params = {
-                "embed_google_oauth_access_token": True,
-                "expire_after": "3600s",
-                "google_oauth_access_token": access_token,
-                "policy_id": "authproxy-oauth-policy",
-            }
-            r = self._call_nest_api(
-                method="post", url=URL_JWT, headers=headers, params=params
-            )
-            if not r:
-                _LOGGER.error("Failed Getting JWT")
-                return False
-            else:
-                self._user_id = r["claims"]["subject"]["nestId"]["id"]
-                self._access_token = r["jwt"]
-        return True
+        return {
+            "method": "get",
+            "url": issue_token,
+            "headers": headers,
+            "endpoint": "issue_token",
+            # Sent from within login(), so a 401 must not log in again
+            "is_retry": True,
+        }
 
-    def _get_cameras(self):
-        cameras = []
+    def _issue_jwt_request(self, access_token):
         headers = {
+            "User-Agent": USER_AGENT,
+            "Authorization": "Bearer " + access_token,
+            "x-goog-api-key": NEST_API_KEY,
+            "Referer": "https://home.nest.com",
+        }
+        params = {
+            "embed_google_oauth_access_token": True,
+            "expire_after": f"{JWT_LIFETIME}s",
+            "google_oauth_access_token": access_token,
+            "policy_id": "authproxy-oauth-policy",
+        }
+        return {
+            "method": "post",
+            "url": URL_JWT,
+            "headers": headers,
+            "params": params,
+            "endpoint": "issue_jwt",
+            # Sent from within login(), so a 401 must not log in again
+            "is_retry": True,
+        }
+
+    def _handle_jwt(self, r):
+        self._user_id = r["claims"]["subject"]["nestId"]["id"]
+        self._access_token = r["jwt"]
+        self._build_request_templates()
+        self._token_expiry = monotonic() + JWT_LIFETIME
+        self._schedule_token_refresh()
+
+    def _webapi_headers(self, cookie_name):
+        return {
             "User-Agent": USER_AGENT,
             "X-Requested-With": "XmlHttpRequest",
             "Referer": "https://home.nest.com/",
-            "cookie": f"user_token={self._access_token}",
+            "cookie": f"{cookie_name}={self._access_token}",
         }
 
-        r = self._call_nest_api(
-            method="get",
-            url=f"{CAMERA_WEBAPI_BASE}/api/cameras."
-            + "get_owned_and_member_of_with_properties",
-            headers=headers,
+    def _build_request_templates(self):
+        """Prebuild the URLs and headers that only change on login.
+
+        Runs again whenever the access token, user id or czfe URL changes.
+        """
+        self._app_launch_url = f"{API_URL}/api/0.1/user/{self._user_id}/app_launch"
+        self._put_url = f"{self._czfe_url}/v5/put"
+        self._subscribe_url = f"{self._czfe_url}/v6/subscribe"
+        self._cameras_url = (
+            f"{CAMERA_WEBAPI_BASE}/api/cameras."
+            "get_owned_and_member_of_with_properties"
         )
+        self._camera_properties_url = (
+            f"{CAMERA_WEBAPI_BASE}/api/dropcams.set_properties"
+        )
+        self._camera_url_prefix = f"{API_URL}/dropcam/api/cameras/"
+        self._get_image_url_prefix = f"{self._camera_url}/get_image?uuid="
+        # Name for the auth argument of _send_nest_api() -> headers
+        self._auth_headers = {
+            # app_launch and czfe, which take JSON bodies
+            "basic": MappingProxyType(
+                {
+                    **DEFAULT_HEADERS,
+                    "Authorization": f"Basic {self._access_token}",
+                    "Content-Type": "application/json",
+                }
+            ),
+            "user_token": MappingProxyType(self._webapi_headers("user_token")),
+            "cztoken": MappingProxyType(self._webapi_headers("cztoken")),
+        }
+
+    async def _get_cameras(self):
+        r = await self._call_nest_api(**self._cameras_request())
         if not r:
             _LOGGER.error("Failed Getting Owned Cameras")
             return False
-        else:
-            for camera in r["items"]:
-                cameras.append(camera["uuid"])
-                self.device_data[camera["uuid"]] = {}
-        return cameras
+        return self._handle_cameras(r)
 
-    def _get_devices(self):
-        url = f"{API_URL}/api/0.1/user/{self._user_id}/app_launch"
-        json = {
-            "known_bucket_types": ["buckets"],
-            "known_bucket_versions": [],
+    def _cameras_request(self):
+        return {
+            "method": "get",
+            "url": self._cameras_url,
+            "auth": "user_token",
+            "endpoint": "cameras",
         }
-        headers = {"Authorization": f"Basic {self._access_token}"}
-        r = self._call_nest_api(method="post", url=url, json=json, headers=headers)
+
+    def _handle_cameras(self, r):
+        """Fill device_data for every camera in a listing response."""
+        cameras = []
+        for camera in r["items"]:
+            cameras.append(camera["uuid"])
+            self.device_data.setdefault(camera["uuid"], CameraState())
+            self._handle_camera(camera["uuid"], camera)
+        return cameras
+
+    async def _get_devices(self):
+        """Discover device buckets; cameras are listed by _setup_cameras()."""
+        r = await self._call_nest_api(**self._app_launch_request(["buckets"]))
         if not r:
             _LOGGER.error("Failed Getting czfe url and buckets")
             return False
+        self._handle_devices(r)
+        return True
 
+    def _handle_devices(self, r):
         self._czfe_url = r["service_urls"]["urls"]["czfe_url"]
+        self._build_request_templates()
 
+        known = set(self.device_data)
+        protects = []
+        temperature_sensors = []
+        thermostats = []
         buckets = r["updated_buckets"][0]["value"]["buckets"]
         for bucket in buckets:
             if bucket.startswith("topaz."):
                 sn = bucket.replace("topaz.", "")
-                self.protects.append(sn)
-                self.device_data[sn] = {}
+                protects.append(sn)
+                self.device_data.setdefault(sn, ProtectState())
             elif bucket.startswith("kryptonite."):
                 sn = bucket.replace("kryptonite.", "")
-                self.temperature_sensors.append(sn)
-                self.device_data[sn] = {}
+                temperature_sensors.append(sn)
+                self.device_data.setdefault(sn, TemperatureSensorState())
             elif bucket.startswith("device."):
                 sn = bucket.replace("device.", "")
-                self.thermostats.append(sn)
-                self.temperature_sensors.append(sn)
-                self.device_data[sn] = {}
-        cameras = self._get_cameras()
-        if cameras is not False:
-            self.cameras = cameras
+                thermostats.append(sn)
+                temperature_sensors.append(sn)
+                self.device_data.setdefault(sn, ThermostatState())
+        self.protects = protects
+        self.temperature_sensors = temperature_sensors
+        self.thermostats = thermostats
+        # Buckets of devices skipped before they were discovered have to be
+        # sent in full once
+        added = set(self.device_data) - known
+        for object_key in list(self._bucket_versions):
+            if object_key.partition(".")[2] in added:
+                del self._bucket_versions[object_key]
+        self._app_launch_bodies.clear()
+
+    def snapshot(self):
+        """Return the auth and device state worth keeping across restarts.
+
+        The result is JSON serializable and can be handed to restore().
+        """
+        token_expires_at = None
+        if self._token_expiry is not None:
+            token_expires_at = time() + self._token_expiry - monotonic()
+        return {
+            "access_token": self._access_token,
+            "token_expires_at": token_expires_at,
+            "user_id": self._user_id,
+            "czfe_url": self._czfe_url,
+            "thermostats": self.thermostats,
+            "temperature_sensors": self.temperature_sensors,
+            "protects": self.protects,
+            "cameras": self.cameras,
+            "wheres": self._wheres,
+            "bucket_versions": list(self._bucket_versions.values()),
+            "device_data": {
+                sn: dict(device) for sn, device in self.device_data.items()
+            },
+        }
+
+    def restore(self, data):
+        """Load state saved by snapshot(), returning False if unusable.
+
+        The JWT is only reused while it has more than JWT_REFRESH_MARGIN
+        left; the restored devices and their data are used either way.
+        """
+        if not data or not data.get("czfe_url"):
+            return False
+        self._user_id = data["user_id"]
+        self._czfe_url = data["czfe_url"]
+        self.thermostats = data["thermostats"]
+        self.temperature_sensors = data["temperature_sensors"]
+        self.protects = data["protects"]
+        self.cameras = data["cameras"]
+        self._wheres = data["wheres"]
+        self._bucket_versions = {
+            version["object_key"]: version for version in data["bucket_versions"]
+        }
+        self._app_launch_bodies.clear()
+        device_data = data["device_data"]
+        self.device_data = {}
+        # Thermostats are listed as temperature sensors too
+        for devices, state_class in (
+            (self.thermostats, ThermostatState),
+            (self.protects, ProtectState),
+            (self.temperature_sensors, TemperatureSensorState),
+            (self.cameras, CameraState),
+        ):
+            for sn in devices:
+                self.device_data.setdefault(sn, state_class(device_data.get(sn, {})))
+        expires_at = data["token_expires_at"]
+        if expires_at is not None and expires_at - time() > JWT_REFRESH_MARGIN:
+            self._access_token = data["access_token"]
+            self._token_expiry = monotonic() + expires_at - time()
+        self._build_request_templates()
+        self._devices_ready.set()
+        self._cameras_ready.set()
         return True
 
+    async def async_revalidate(self):
+        """Bring state loaded by restore() up to date.
+
+        Entities can be created from the restored state straight away, this
+        logs in only if the restored JWT is unusable and then refreshes the
+        device list, device data and cameras.
+        """
+        if self._token_valid():
+            self._schedule_token_refresh()
+        elif not await self.login():
+            return False
+        if await self._get_devices():
+            await asyncio.gather(self.update(), self.update_cameras())
+        return True
+
+    async def async_wait_devices(self):
+        """Wait until thermostats, sensors and Protects are loaded."""
+        await self._devices_ready.wait()
+
+    async def async_wait_cameras(self):
+        """Wait until cameras are loaded."""
+        await self._cameras_ready.wait()
+
+    def _token_valid(self):
+        return (
+            self._token_expiry is not None
+            and self._token_expiry - monotonic() > JWT_REFRESH_MARGIN
+        )
+
     def _map_nest_protect_state(self, value):
         if value == 0:
             return "Ok"
@@ -290,315 +851,504 @@ class NestAPI:
         else:
             return "Unkown"
 
-    def update_camera(self, camera):
-        headers = {
-            "User-Agent": USER_AGENT,
-            "X-Requested-With": "XmlHttpRequest",
-            "Referer": "https://home.nest.com/",
-            "cookie": f"cztoken={self._access_token}",
-        }
-        url = f"{API_URL}/dropcam/api/cameras/{camera}"
-        r = self._call_nest_api(method="get", url=url, headers=headers)
+    async def update_cameras(self):
+        """Refresh all cameras from one listing call, coalesced like update()."""
+        async with self._camera_update_lock:
+            if not self._due_tiers(["cameras"]) or self._breakers["camera"].is_open:
+                return
+            self._refreshed(["cameras"])
+            await self._get_cameras()
+        self._notify_update_listeners()
+
+    async def update_camera(self, camera):
+        r = await self._call_nest_api(**self._camera_request(camera))
         if not r:
             _LOGGER.error("Failed Getting camers")
             return
-        else:
-            sensor_data = r[0]
-            self.device_data[camera]["name"] = sensor_data["name"]
-            self.device_data[camera]["is_online"] = sensor_data["is_online"]
-            self.device_data[camera]["is_streaming"] = sensor_data["is_streaming"]
-            self.device_data[camera]["battery_voltage"] = sensor_data[
-                "rq_battery_battery_volt"
-            ]
-            self.device_data[camera]["ac_voltage"] = sensor_data[
-                "rq_battery_vbridge_volt"
-            ]
-            self.device_data[camera]["location"] = sensor_data["location"]
-            self.device_data[camera]["data_tier"] = sensor_data["properties"][
-                "streaming.data-usage-tier"
-            ]
-
-    def update(self):
-        # To get friendly names
-        APP_LAUNCH_URL = f"{API_URL}/api/0.1/user/{self._user_id}/app_launch"
-        APP_LAUNCH_HEADERS = {"Authorization": f"Basic {self._access_token}"}
-        APP_LAUNCH_JSON = {
-            "known_bucket_types": ["where"],
-            "known_bucket_versions": [],
+        self._handle_camera(camera, r[0])
+
+    def _camera_request(self, camera):
+        return {
+            "method": "get",
+            "url": self._camera_url_prefix + camera,
+            "auth": "cztoken",
+            "endpoint": "dropcam_camera",
         }
-        r = self._call_nest_api(
-            method="post",
-            url=APP_LAUNCH_URL,
-            json=APP_LAUNCH_JSON,
-            headers=APP_LAUNCH_HEADERS,
-        )
-        if not r:
-            _LOGGER.error("Failed Calling App Launch")
-            return False
-        buckets = r["updated_buckets"]
-        for bucket in buckets:
-            sensor_data = bucket["value"]
-            sn = bucket["object_key"].split(".")[1]
-            if bucket["object_key"].startswith(f"where.{sn}"):
-                wheres = sensor_data["wheres"]
-                for where in wheres:
-                    self._wheres[where["where_id"]] = where["name"]
-
-        APP_LAUNCH_JSON = {
-            "known_bucket_types": KNOWN_BUCKET_TYPES,
-            "known_bucket_versions": [],
+
+    def _handle_camera(self, camera, sensor_data):
+        device = self.device_data[camera]
+        before = device.astuple()
+        device.name = sensor_data["name"]
+        device.is_online = sensor_data["is_online"]
+        device.is_streaming = sensor_data["is_streaming"]
+        # Not every camera model reports battery details in the listing
+        device.battery_voltage = sensor_data.get("rq_battery_battery_volt")
+        device.ac_voltage = sensor_data.get("rq_battery_vbridge_volt")
+        device.location = sensor_data["location"]
+        device.data_tier = sensor_data["properties"]["streaming.data-usage-tier"]
+        if device.astuple() != before:
+            self._changed_devices.add(camera)
+
+    async def update(self):
+        """Refresh the refresh tiers that are due, coalescing concurrent calls."""
+        async with self._update_lock:
+            tiers = self._due_tiers(REFRESH_TIER_BUCKETS)
+            if not tiers or self._breakers["app_launch"].is_open:
+                return self.device_data
+            self._refreshed(tiers)
+            result = await self._update(self._tier_bucket_types(tiers))
+        self._notify_update_listeners()
+        return result
+
+    def _due_tiers(self, tiers):
+        """Return the refresh tiers whose interval has passed.
+
+        Polls up to MIN_TIME_BETWEEN_UPDATES seconds early still count, so a
+        timer ticking at a tier's interval doesn't skip every other refresh.
+        """
+        now = monotonic()
+        due = []
+        for tier in tiers:
+            last_refresh = self._last_refresh.get(tier)
+            interval = max(
+                self._refresh_intervals[tier] - MIN_TIME_BETWEEN_UPDATES,
+                MIN_TIME_BETWEEN_UPDATES,
+            )
+            if last_refresh is None or now - last_refresh >= interval:
+                due.append(tier)
+        return due
+
+    def _refreshed(self, tiers):
+        now = monotonic()
+        for tier in tiers:
+            self._last_refresh[tier] = now
+
+    def _tier_bucket_types(self, tiers):
+        # Devices are named after their room, so every poll asks for the where
+        # bucket too. Its version is known, so it only comes back if changed.
+        return ["where"] + [
+            bucket_type for tier in tiers for bucket_type in REFRESH_TIER_BUCKETS[tier]
+        ]
+
+    def _known_bucket_versions(self, bucket_types):
+        """Return the versions we hold for buckets of the given types."""
+        return [
+            version
+            for object_key, version in self._bucket_versions.items()
+            if object_key.split(".")[0] in bucket_types
+        ]
+
+    def _remember_bucket_version(self, bucket):
+        """Record a bucket's revision so the server can skip it next time."""
+        if "object_revision" not in bucket or "object_timestamp" not in bucket:
+            return
+        self._bucket_versions[bucket["object_key"]] = {
+            "object_key": bucket["object_key"],
+            "object_revision": bucket["object_revision"],
+            "object_timestamp": bucket["object_timestamp"],
         }
-        r = self._call_nest_api(
-            method="post",
-            url=APP_LAUNCH_URL,
-            json=APP_LAUNCH_JSON,
-            headers=APP_LAUNCH_HEADERS,
+        self._app_launch_bodies.clear()
+
+    def _forget_bucket_versions(self, bucket_types):
+        """Drop stored versions so buckets of these types are sent in full."""
+        for object_key in list(self._bucket_versions):
+            if object_key.split(".")[0] in bucket_types:
+                del self._bucket_versions[object_key]
+        self._app_launch_bodies.clear()
+
+    def _app_launch_request(self, bucket_types):
+        # Polls where nothing changed send the same body again
+        key = tuple(bucket_types)
+        body = self._app_launch_bodies.get(key)
+        if body is None:
+            body = self._app_launch_bodies[key] = self.codec.dumps(
+                {
+                    "known_bucket_types": bucket_types,
+                    "known_bucket_versions": self._known_bucket_versions(bucket_types),
+                }
+            )
+        return {
+            "method": "post",
+            "url": self._app_launch_url,
+            "data": body,
+            "auth": "basic",
+            "endpoint": "app_launch",
+        }
+
+    async def _update(self, bucket_types):
+        known = bool(self._bucket_versions)
+        stream = await self._app_launch(bucket_types)
+        if not stream:
+            return False
+        if stream.rooms_changed and known:
+            return await self._update_devices()
+        return self.device_data
+
+    async def _update_wheres(self):
+        """Fetch room names on their own, so setup can run it in parallel."""
+        return bool(await self._app_launch(["where"]))
+
+    async def _update_devices(self):
+        if not await self._app_launch(KNOWN_BUCKET_TYPES):
+            return False
+        return self.device_data
+
+    async def _app_launch(self, bucket_types):
+        stream = BucketStream(self, bucket_types)
+        r = await self._call_nest_api(
+            **self._app_launch_request(bucket_types), stream=stream
         )
         if not r:
             _LOGGER.error("Failed Calling App Launch")
             return False
+        stream.close()
+        return stream
+
+    @property
+    def poll_interval(self):
+        """Return the seconds between two polls that keep every tier on time."""
+        return min(self._refresh_intervals.values())
+
+    @property
+    def subscribed(self):
+        """Return True when device_data is kept current by the subscriber."""
+        return self._subscriber is not None
+
+    def add_update_listener(self, listener, device_id=None):
+        """Call listener whenever the data of a device changed.
+
+        With a device_id the listener only hears about that device, without
+        one about every change. Returns a function that removes the listener
+        again.
+        """
+        listeners = self._update_listeners.setdefault(device_id, [])
+        listeners.append(listener)
+
+        def remove_listener():
+            if listener in listeners:
+                listeners.remove(listener)
+
+        return remove_listener
+
+    def _notify_update_listeners(self):
+        """Notify the listeners of the devices changed since the last call."""
+        changed, self._changed_devices = self._changed_devices, set()
+        if not changed:
+            return
+        for device_id in changed:
+            for listener in list(self._update_listeners.get(device_id, ())):
+                listener()
+        for listener in list(self._update_listeners.get(None, ())):
+            listener()
+
+    def start_subscription(self):
+        """Start the task that long-polls czfe for changes."""
+        if self._subscriber is not None:
+            return
+        self._subscriber = asyncio.ensure_future(self._subscribe_loop())
+
+    def stop_subscription(self):
+        """Cancel the subscribe task, including a pending long-poll."""
+        if self._subscriber is not None:
+            self._subscriber.cancel()
+        self._subscriber = None
+
+    async def _subscribe_loop(self):
+        await self._devices_ready.wait()
+        delay = 0
+        while True:
+            started = monotonic()
+            changed = await self.subscribe()
+            if changed is False:
+                delay = SUBSCRIBE_RETRY_DELAY
+            elif changed or monotonic() - started >= SUBSCRIBE_MIN_HOLD:
+                delay = 0
+            else:
+                delay = min(max(delay * 2, SUBSCRIBE_MIN_DELAY), SUBSCRIBE_RETRY_DELAY)
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def subscribe(self):
+        """Wait for changes to the buckets we hold and apply them.
+
+        Returns the number of changed buckets, or False if the call failed.
+        """
+        request = self._subscribe_request()
+        if not request["json"]["objects"]:
+            # Nothing to watch, e.g. an account with cameras only
+            return 0
+        r = await self._call_nest_api(**request)
+        if r is False:
+            _LOGGER.error("Failed Subscribing To Bucket Changes")
+            return False
+
+        buckets = r.get("objects", [])
+        if not buckets:
+            return 0
+        async with self._update_lock:
+            if self._apply_buckets(buckets):
+                # A room rename dropped the device versions, fetch them again.
+                await self._update_devices()
+        self._notify_update_listeners()
+        return len(buckets)
+
+    def _subscribe_request(self):
+        return {
+            "method": "post",
+            "url": self._subscribe_url,
+            "json": {
+                "objects": self._known_bucket_versions(KNOWN_BUCKET_TYPES + ["where"])
+            },
+            "auth": "basic",
+            "timeout": SUBSCRIBE_TIMEOUT,
+            "endpoint": "subscribe",
+        }
+
+    def _apply_buckets(self, buckets):
+        """Apply app_launch or subscribe buckets.
 
-        buckets = r["updated_buckets"]
+        Returns True if the where bucket was among them, i.e. a room changed.
+        """
+        # Room names have to be known before the devices that use them.
+        buckets.sort(key=lambda bucket: not bucket["object_key"].startswith("where."))
         for bucket in buckets:
-            sensor_data = bucket["value"]
-            sn = bucket["object_key"].split(".")[1]
-            # Thermostats (thermostat and sensors system)
-            if bucket["object_key"].startswith(f"shared.{sn}"):
-                self.device_data[sn]["current_temperature"] = sensor_data[
-                    "current_temperature"
-                ]
-                self.device_data[sn]["target_temperature"] = sensor_data[
-                    "target_temperature"
-                ]
-                self.device_data[sn]["hvac_ac_state"] = sensor_data["hvac_ac_state"]
-                self.device_data[sn]["hvac_heater_state"] = sensor_data[
-                    "hvac_heater_state"
-                ]
-                self.device_data[sn]["target_temperature_high"] = sensor_data[
-                    "target_temperature_high"
-                ]
-                self.device_data[sn]["target_temperature_low"] = sensor_data[
-                    "target_temperature_low"
-                ]
-                self.device_data[sn]["can_heat"] = sensor_data["can_heat"]
-                self.device_data[sn]["can_cool"] = sensor_data["can_cool"]
-                self.device_data[sn]["mode"] = sensor_data["target_temperature_type"]
-                if self.device_data[sn]["hvac_ac_state"]:
-                    self.device_data[sn]["action"] = "cooling"
-                elif self.device_data[sn]["hvac_heater_state"]:
-                    self.device_data[sn]["action"] = "heating"
-                else:
-                    self.device_data[sn]["action"] = "off"
-            # Thermostats, pt 2
-            elif bucket["object_key"].startswith(f"device.{sn}"):
-                self.device_data[sn]["name"] = self._wheres[sensor_data["where_id"]]
-                # When acts as a sensor
-                if "backplate_temperature" in sensor_data:
-                    self.device_data[sn]["temperature"] = sensor_data[
-                        "backplate_temperature"
-                    ]
-                if "battery_level" in sensor_data:
-                    self.device_data[sn]["battery_level"] = sensor_data["battery_level"]
-
-                if sensor_data.get("description", None):
-                    self.device_data[sn]["name"] += f' ({sensor_data["description"]})'
-                self.device_data[sn]["name"] += " Thermostat"
-                self.device_data[sn]["has_fan"] = sensor_data["has_fan"]
-                self.device_data[sn]["fan"] = sensor_data["fan_timer_timeout"]
-                self.device_data[sn]["current_humidity"] = sensor_data[
-                    "current_humidity"
-                ]
-                self.device_data[sn]["target_humidity"] = sensor_data["target_humidity"]
-                self.device_data[sn]["target_humidity_enabled"] = sensor_data[
-                    "target_humidity_enabled"
-                ]
-                if (
-                    sensor_data["eco"]["mode"] == "manual-eco"
-                    or sensor_data["eco"]["mode"] == "auto-eco"
-                ):
-                    self.device_data[sn]["eco"] = True
-                else:
-                    self.device_data[sn]["eco"] = False
-            # Protect
-            elif bucket["object_key"].startswith(f"topaz.{sn}"):
-                self.device_data[sn]["name"] = self._wheres[sensor_data["where_id"]]
-                if sensor_data.get("description", None):
-                    self.device_data[sn]["name"] += f' ({sensor_data["description"]})'
-                self.device_data[sn]["name"] += " Protect"
-                self.device_data[sn]["co_status"] = self._map_nest_protect_state(
-                    sensor_data["co_status"]
-                )
-                self.device_data[sn]["smoke_status"] = self._map_nest_protect_state(
-                    sensor_data["smoke_status"]
-                )
-                self.device_data[sn][
-                    "battery_health_state"
-                ] = self._map_nest_protect_state(sensor_data["battery_health_state"])
-            # Temperature sensors
-            elif bucket["object_key"].startswith(f"kryptonite.{sn}"):
-                self.device_data[sn]["name"] = self._wheres[sensor_data["where_id"]]
-                if sensor_data.get("description", None):
-                    self.device_data[sn]["name"] += f' ({sensor_data["description"]})'
-                self.device_data[sn]["name"] += " Temperature"
-                self.device_data[sn]["temperature"] = sensor_data["current_temperature"]
-                if sensor_data.get("description", None):
-                    self.device_data[sn]["name"] += f' ({sensor_data["description"]})'
-                self.device_data[sn]["name"] += " Temperature"
-                self.device_data[sn]["temperature"] = sensor_data["current_temperature"]
-                self.device_data[sn]["battery_level"] = sensor_data["battery_level"]
-        return self.device_data
+            self._process_bucket(bucket)
+        return bool(buckets) and buckets[0]["object_key"].startswith("where.")
 
-    def thermostat_set_temperature(self, device_id, temp, temp_high=None):
+    def _process_bucket(self, bucket):
+        """Apply one app_launch or subscribe bucket to device_data."""
+        object_type, _, sn = bucket["object_key"].partition(".")
+        parser = self._bucket_parsers.get(object_type)
+        if parser is None:
+            return
+        sensor_data = bucket["value"]
+        # None for the where bucket, which belongs to the structure
+        device = self.device_data.get(sn)
+        if device is None and object_type != "where":
+            # Added to the account since devices were discovered. Remembering
+            # its version keeps it from coming back in full on every poll.
+            self._remember_bucket_version(bucket)
+            return
+        before = None if device is None else device.astuple()
+        fields = BUCKET_FIELDS.get(object_type)
+        if fields is not None:
+            for key, field in fields.items():
+                setattr(device, key, sensor_data[field])
+        parser(sn, sensor_data)
+        if device is not None and device.astuple() != before:
+            self._changed_devices.add(sn)
+        self._remember_bucket_version(bucket)
+
+    def _parse_where(self, sn, sensor_data):
+        for where in sensor_data["wheres"]:
+            self._wheres[where["where_id"]] = where["name"]
+        # Device names embed the room name, so re-fetch every device
+        # bucket when a room was renamed.
+        self._forget_bucket_versions(KNOWN_BUCKET_TYPES)
+
+    # Thermostats (thermostat and sensors system)
+    def _parse_shared(self, sn, sensor_data):
+        device = self.device_data[sn]
+        if device.hvac_ac_state:
+            device.action = "cooling"
+        elif device.hvac_heater_state:
+            device.action = "heating"
+        else:
+            device.action = "off"
+
+    # Thermostats, pt 2
+    def _parse_device(self, sn, sensor_data):
+        device = self.device_data[sn]
+        device.name = self._device_name(sn, sensor_data, "Thermostat")
+        # When acts as a sensor
+        if "backplate_temperature" in sensor_data:
+            device.temperature = sensor_data["backplate_temperature"]
+        if "battery_level" in sensor_data:
+            device.battery_level = sensor_data["battery_level"]
+        device.eco = self._is_eco(sensor_data["eco"])
+
+    # Protect
+    def _parse_topaz(self, sn, sensor_data):
+        device = self.device_data[sn]
+        device.name = self._device_name(sn, sensor_data, "Protect")
+        device.co_status = self._map_nest_protect_state(sensor_data["co_status"])
+        device.smoke_status = self._map_nest_protect_state(sensor_data["smoke_status"])
+        device.battery_health_state = self._map_nest_protect_state(
+            sensor_data["battery_health_state"]
+        )
+
+    # Temperature sensors
+    def _parse_kryptonite(self, sn, sensor_data):
+        self.device_data[sn].name = self._device_name(sn, sensor_data, "Temperature")
+
+    def _device_name(self, sn, sensor_data, kind):
+        """Name a device after its room and description, e.g. "Hall (Up) Protect".
+
+        A device moved into a room we don't know yet keeps its name, and the
+        where bucket is fetched in full on the next poll. Its arrival renames
+        every device.
+        """
+        name = self._wheres.get(sensor_data["where_id"])
+        if name is None:
+            _LOGGER.debug(f"Unknown room {sensor_data['where_id']} for {sn}")
+            self._forget_bucket_versions(["where"])
+            return self.device_data[sn].name or kind
+        if sensor_data.get("description", None):
+            name += f' ({sensor_data["description"]})'
+        return f"{name} {kind}"
+
+    async def _thermostat_put(self, device_id, object_key, value, description):
         if device_id not in self.thermostats:
             _LOGGER.error(
-                f"Failed Setting Thermostat Temperature, Invalid Device ID: {device_id}"
+                f"Failed Setting Thermostat {description}, "
+                f"Invalid Device ID: {device_id}"
             )
             return False
-        url = f"{self._czfe_url}/v5/put"
-        headers = {"Authorization": f"Basic {self._access_token}"}
-        if temp_high is None:
-            json = {
+        if not await self._queue_write(object_key, value):
+            _LOGGER.error(f"Failed Setting Thermostat {description}")
+            return False
+        self._apply_write(object_key, value)
+        return True
+
+    def _queue_write(self, object_key, value):
+        """Add a MERGE to the pending batch, returning a future for its result.
+
+        Writes queued within WRITE_BATCH_DELAY of the first one are merged
+        per object_key and sent together as a single /v5/put.
+        """
+        loop = asyncio.get_event_loop()
+        if object_key not in self._pending_writes:
+            self._pending_writes[object_key] = ({}, loop.create_future())
+        pending_value, result = self._pending_writes[object_key]
+        pending_value.update(value)
+        if self._write_flush is None:
+            self._write_flush = loop.call_later(
+                WRITE_BATCH_DELAY, lambda: asyncio.ensure_future(self._flush_writes())
+            )
+        return result
+
+    async def _flush_writes(self):
+        pending, self._pending_writes = self._pending_writes, {}
+        self._write_flush = None
+        objects = {object_key: value for object_key, (value, _) in pending.items()}
+        results = {}
+        try:
+            r = await self._call_nest_api(**self._put_request(objects))
+            results = self._handle_put(r, objects)
+        finally:
+            for object_key, (_, result) in pending.items():
+                if not result.done():
+                    result.set_result(results.get(object_key, False))
+
+    def _is_eco(self, eco):
+        return eco["mode"] == "manual-eco" or eco["mode"] == "auto-eco"
+
+    def _apply_write(self, object_key, value):
+        """Reflect a successful MERGE in device_data right away.
+
+        The bucket version is left alone, so the next sync still fetches the
+        bucket and reconciles with what the server actually stored.
+        """
+        sn = object_key.split(".")[1]
+        device = self.device_data[sn]
+        for field, field_value in value.items():
+            if field == "target_temperature_type":
+                device.mode = field_value
+            elif field == "fan_timer_timeout":
+                device.fan = field_value
+            elif field == "eco":
+                device.eco = self._is_eco(field_value)
+            else:
+                device[field] = field_value
+        # Entities don't poll after a service call
+        self._changed_devices.add(sn)
+        self._notify_update_listeners()
+
+    def _put_request(self, objects):
+        """Build one /v5/put merging each object_key -> value of objects."""
+        return {
+            "method": "post",
+            "url": self._put_url,
+            "json": {
                 "objects": [
-                    {
-                        "object_key": f"shared.{device_id}",
-                        "op": "MERGE",
-                        "value": {"target_temperature": temp},
-                    }
+                    {"object_key": object_key, "op": "MERGE", "value": value}
+                    for object_key, value in objects.items()
                 ]
-            }
+            },
+            "auth": "basic",
+            "endpoint": "v5_put",
+        }
+
+    def _handle_put(self, r, objects):
+        """Map each written object_key to whether the server accepted it."""
+        if not r:
+            return {object_key: False for object_key in objects}
+        if "objects" not in r:
+            return {object_key: True for object_key in objects}
+        written = {obj["object_key"] for obj in r["objects"]}
+        return {object_key: object_key in written for object_key in objects}
+
+    def thermostat_set_temperature(self, device_id, temp, temp_high=None):
+        if temp_high is None:
+            value = {"target_temperature": temp}
         else:
-            json = {
-                "objects": [
-                    {
-                        "object_key": f"shared.{device_id}",
-                        "op": "MERGE",
-                        "value": {
-                            "target_temperature_low": temp,
-                            "target_temperature_high": temp_high,
-                        },
-                    }
-                ]
+            value = {
+                "target_temperature_low": temp,
+                "target_temperature_high": temp_high,
             }
-        r = self._call_nest_api(method="post", url=url, json=json, headers=headers)
-        if not r:
-            _LOGGER.error("Failed Setting Thermostat Temperature")
-            return False
-        return True
+        return self._thermostat_put(
+            device_id, f"shared.{device_id}", value, "Temperature"
+        )
 
     def thermostat_set_target_humidity(self, device_id, humidity):
-        _LOGGER.error(
-            f"Failed Setting Thermostat Humidity, Invalid Device ID: {device_id}"
+        return self._thermostat_put(
+            device_id, f"device.{device_id}", {"target_humidity": humidity}, "Humidity"
         )
-        if device_id not in self.thermostats:
-            return False
-        url = f"{self._czfe_url}/v5/put"
-        json = {
-            "objects": [
-                {
-                    "object_key": f"device.{device_id}",
-                    "op": "MERGE",
-                    "value": {"target_humidity": humidity},
-                }
-            ]
-        }
-        headers = {"Authorization": f"Basic {self._access_token}"}
-        r = self._call_nest_api(method="post", url=url, json=json, headers=headers)
-        if not r:
-            _LOGGER.error("Failed Setting Thermostat Humidity")
-            return False
-        return True
 
     def thermostat_set_mode(self, device_id, mode):
-        if device_id not in self.thermostats:
-            _LOGGER.error(
-                f"Failed Setting Thermostat Mode, Invalid Device ID: {device_id}"
-            )
-            return False
-        url = f"{self._czfe_url}/v5/put"
-        json = {
-            "objects": [
-                {
-                    "object_key": f"shared.{device_id}",
-                    "op": "MERGE",
-                    "value": {"target_temperature_type": mode},
-                }
-            ]
-        }
-        headers = {"Authorization": f"Basic {self._access_token}"}
-        r = self._call_nest_api(method="post", url=url, json=json, headers=headers)
-        if not r:
-            _LOGGER.error("Failed Setting Thermostat Mode")
-            return False
-        return True
+        return self._thermostat_put(
+            device_id, f"shared.{device_id}", {"target_temperature_type": mode}, "Mode"
+        )
 
     def thermostat_set_fan(self, device_id, date):
-        if device_id not in self.thermostats:
-            _LOGGER.error(
-                f"Failed Setting Thermostat Fan, Invalid Device ID: {device_id}"
-            )
-            return False
-        url = f"{self._czfe_url}/v5/put"
-        json = {
-            "objects": [
-                {
-                    "object_key": f"device.{device_id}",
-                    "op": "MERGE",
-                    "value": {"fan_timer_timeout": date},
-                }
-            ]
-        }
-        headers = {"Authorization": f"Basic {self._access_token}"}
-        r = self._call_nest_api(method="post", url=url, json=json, headers=headers)
-        if not r:
-            _LOGGER.error("Failed Setting Thermostat Mode")
-            return False
-        return True
+        return self._thermostat_put(
+            device_id, f"device.{device_id}", {"fan_timer_timeout": date}, "Fan"
+        )
 
     def thermostat_set_eco_mode(self, device_id, state):
-        if device_id not in self.thermostats:
-            _LOGGER.error(
-                f"Failed Setting Thermostat Eco Mode, Invalid Device ID: {device_id}"
-            )
-            return False
         mode = "manual-eco" if state else "schedule"
-        url = f"{self._czfe_url}/v5/put"
-        json = {
-            "objects": [
-                {
-                    "object_key": f"device.{device_id}",
-                    "op": "MERGE",
-                    "value": {"eco": {"mode": mode}},
-                }
-            ]
-        }
-        headers = {"Authorization": f"Basic {self._access_token}"}
-        r = self._call_nest_api(method="post", url=url, json=json, headers=headers)
-        if not r:
-            _LOGGER.error("Failed Setting Thermostat Eco Mode")
-            return False
-        return True
+        return self._thermostat_put(
+            device_id, f"device.{device_id}", {"eco": {"mode": mode}}, "Eco Mode"
+        )
 
-    def _camera_set_properties(self, device_id, property, value):
+    async def _camera_set_properties(self, device_id, property, value):
         if device_id not in self.cameras:
             _LOGGER.error(
                 f"Failed Setting Camera Properties, Invalid Device ID: {device_id}"
             )
             return False
-
-        headers = {
-            "User-Agent": USER_AGENT,
-            "X-Requested-With": "XmlHttpRequest",
-            "Referer": "https://home.nest.com/",
-            "cookie": f"user_token={self._access_token}",
-        }
-        url = f"{CAMERA_WEBAPI_BASE}/api/dropcams.set_properties"
-        data = {property: value, "uuid": device_id}
-        r = self._call_nest_api(method="get", url=url, data=data, headers=headers)
+        r = await self._call_nest_api(
+            **self._camera_properties_request(device_id, property, value)
+        )
         if not r:
             _LOGGER.error("Failed Setting Thermostat Eco Mode")
             return False
+        # Show the new state now rather than at the next cameras refresh, and
+        # list the cameras again on the next poll in case Nest lagged behind
+        await self.update_camera(device_id)
+        self._last_refresh.pop("cameras", None)
+        self._notify_update_listeners()
         return r["items"]
 
+    def _camera_properties_request(self, device_id, property, value):
+        return {
+            "method": "get",
+            "url": self._camera_properties_url,
+            "data": {property: value, "uuid": device_id},
+            "auth": "user_token",
+            "endpoint": "set_properties",
+        }
+
     def camera_turn_off(self, device_id):
 
         return self._camera_set_properties(device_id, "streaming.enabled", "false")
@@ -607,19 +1357,109 @@ class NestAPI:
 
         return self._camera_set_properties(device_id, "streaming.enabled", "true")
 
-    def camera_get_image(self, device_id, now):
+    async def camera_get_image(self, device_id, now, width=None):
         if device_id not in self.cameras:
             _LOGGER.error(f"Failed to get camera Image, Invalid Device ID: {device_id}")
             return False
-        headers = {
-            "User-Agent": USER_AGENT,
-            "X-Requested-With": "XmlHttpRequest",
-            "Referer": "https://home.nest.com/",
-            "cookie": f"user_token={self._access_token}",
-        }
-        url = f"{self._camera_url}/get_image?uuid={device_id}&cachebuster={now}"
-        r = self._call_nest_api(method="get", url=url, headers=headers, is_json=False)
+        r = await self._call_nest_api(
+            **self._camera_image_request(device_id, now, width)
+        )
         if not r:
             _LOGGER.error("Failed Getting Camera Image")
             return False
         return r
+
+    async def camera_get_cached_image(self, device_id, width=None):
+        """Return a snapshot no older than the snapshot interval.
+
+        Each requested width is cached separately. Concurrent callers share
+        one download per camera and width. While it runs, callers get the
+        previous image right away if there is one.
+        """
+        key = (device_id, self._snapshot_width(width))
+        image = self._cached_camera_image(key)
+        if image is not None:
+            return image
+        fetch = self._camera_image_fetches.get(key)
+        if fetch is None:
+            fetch = asyncio.ensure_future(self._fetch_camera_image(key))
+            self._camera_image_fetches[key] = fetch
+        cached = self._camera_images.get(key)
+        if cached is not None:
+            return cached[1]
+        return await asyncio.shield(fetch)
+
+    def camera_frames(self, device_id):
+        """Return an async iterator over the live frames of a camera.
+
+        All iterators of a camera share one CameraFeed, which downloads a full
+        size snapshot every stream interval while any of them is open. Close
+        the iterator with aclose() when done watching.
+        """
+        feed = self._camera_feeds.get(device_id)
+        if feed is None:
+            feed = CameraFeed(
+                functools.partial(self._fetch_camera_frame, device_id),
+                self._stream_interval,
+            )
+            self._camera_feeds[device_id] = feed
+        return feed.frames()
+
+    async def _fetch_camera_frame(self, device_id):
+        image = await self.camera_get_image(device_id, int(time()))
+        if image:
+            # Still images asked for meanwhile reuse the stream's frames
+            self._store_camera_image((device_id, None), image)
+        return image
+
+    async def _fetch_camera_image(self, key):
+        device_id, width = key
+        try:
+            image = await self.camera_get_image(device_id, int(time()), width)
+            return self._store_camera_image(key, image)
+        finally:
+            del self._camera_image_fetches[key]
+
+    def _snapshot_width(self, width):
+        """Round a requested snapshot width up to a cached size variant.
+
+        Dashboards ask for many slightly different widths, rounding them keeps
+        the number of cached variants per camera small. None means full size.
+        """
+        if width is None or width >= SNAPSHOT_MAX_WIDTH:
+            return None
+        steps = max(1, math.ceil(width / SNAPSHOT_WIDTH_STEP))
+        return steps * SNAPSHOT_WIDTH_STEP
+
+    def _cached_camera_image(self, key):
+        """Return the cached image for a variant unless it is due a refresh."""
+        cached = self._camera_images.get(key)
+        if cached is None or monotonic() - cached[0] >= self._snapshot_interval:
+            return None
+        return cached[1]
+
+    def _store_camera_image(self, key, image):
+        """Cache a downloaded image and return the image to hand out.
+
+        A failed download keeps the previous image but still restarts the
+        interval, so an unreachable camera is not retried on every view.
+        """
+        if not image:
+            cached = self._camera_images.get(key)
+            image = cached[1] if cached is not None else None
+        if image is not None:
+            self._camera_images[key] = (monotonic(), image)
+        return image
+
+    def _camera_image_request(self, device_id, now, width=None):
+        url = f"{self._get_image_url_prefix}{device_id}&cachebuster={now}"
+        if width is not None:
+            # nexus scales the snapshot down server side
+            url += f"&width={width}"
+        return {
+            "method": "get",
+            "url": url,
+            "auth": "user_token",
+            "is_json": False,
+            "endpoint": "get_image",
+        }
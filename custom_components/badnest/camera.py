@@ -1,27 +1,37 @@
 """This component provides basic support for Foscam IP cameras."""
+import functools
 import logging
-from datetime import timedelta
 
+from aiohttp import web
 from homeassistant.components.camera import (
     Camera,
     SUPPORT_ON_OFF,
 )
-from homeassistant.util.dt import utcnow
 
+from . import async_setup_accounts
 from .const import DOMAIN
 
 _LOGGER = logging.getLogger(__name__)
 
+MJPEG_BOUNDARY = "frameboundary"
+
 
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """Set up a Nest Camera."""
-    api = hass.data[DOMAIN]["api"]
+    await async_setup_accounts(
+        hass, functools.partial(async_setup_account, async_add_entities)
+    )
+
+
+async def async_setup_account(async_add_entities, account, api):
+    """Set up the cameras of one Nest account."""
+    await api.async_wait_cameras()
 
     cameras = []
     _LOGGER.info("Adding temperature sensors")
     for camera in api["cameras"]:
         _LOGGER.info(f"Adding nest camera uuid: {camera}")
-        cameras.append(NestCamera(camera, api))
+        cameras.append(NestCamera(camera, api, account))
 
     async_add_entities(cameras)
 
@@ -29,76 +39,105 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
 class NestCamera(Camera):
     """An implementation of a Nest camera."""
 
-    def __init__(self, uuid, api):
+    def __init__(self, uuid, api, account=None):
         """Initialize a Nest camera."""
         super().__init__()
         self._uuid = uuid
         self._device = api
-        self._time_between_snapshots = timedelta(seconds=30)
-        self._last_image = None
-        self._next_snapshot_at = None
+        self._device_state = api.device_data[uuid]
+        self._account = account
 
     @property
     def device_info(self):
         """Return information about the device."""
         return {
-            "identifiers": {(DOMAIN, self._uuid)},
-            "name": self._device.device_data[self._uuid]["name"],
+            "identifiers": {(DOMAIN, self.unique_id)},
+            "name": self.name,
             "manufacturer": "Nest Labs",
             "model": "Camera",
         }
 
     @property
     def should_poll(self):
-        return True
+        """Return False, the account's poll refreshes all cameras at once."""
+        return False
+
+    async def async_added_to_hass(self):
+        """Register for updates of this camera's data."""
+        self._remove_listener = self._device.add_update_listener(
+            self.async_schedule_update_ha_state, self._uuid
+        )
+
+    async def async_will_remove_from_hass(self):
+        """Stop receiving updates."""
+        self._remove_listener()
 
     @property
     def unique_id(self):
         """Return an unique ID."""
+        if self._account:
+            return f"{self._account}_{self._uuid}"
         return self._uuid
 
     @property
     def is_on(self):
         """Return true if on."""
-        return self._device.device_data[self._uuid]["is_online"]
+        return self._device_state.is_online
 
     @property
     def is_recording(self):
         """Return true if the device is recording."""
-        return self._device.device_data[self._uuid]["is_streaming"]
+        return self._device_state.is_streaming
 
-    def turn_off(self):
-        self._device.camera_turn_off(self._uuid)
-        self.schedule_update_ha_state()
+    async def async_turn_off(self):
+        await self._device.camera_turn_off(self._uuid)
+        self.async_schedule_update_ha_state()
 
-    def turn_on(self):
-        self._device.camera_turn_on(self._uuid)
-        self.schedule_update_ha_state()
+    async def async_turn_on(self):
+        await self._device.camera_turn_on(self._uuid)
+        self.async_schedule_update_ha_state()
 
     @property
     def supported_features(self):
         """Return supported features."""
         return SUPPORT_ON_OFF
 
-    def update(self):
+    async def async_update(self):
         """Cache value from Python-nest."""
-        self._device.update_camera(self._uuid)
+        await self._device.update_cameras()
 
     @property
     def name(self):
         """Return the name of this camera."""
-        return self._device.device_data[self._uuid]["name"]
-
-    def _ready_for_snapshot(self, now):
-        return self._next_snapshot_at is None or now > self._next_snapshot_at
+        if self._account:
+            return f"{self._account} {self._device_state.name}"
+        return self._device_state.name
 
-    def camera_image(self):
+    async def async_camera_image(self, width=None, height=None):
         """Return a still image response from the camera."""
-        now = utcnow()
-        if self._ready_for_snapshot(now) or True:
-            image = self._device.camera_get_image(self._uuid, now)
-
-            self._next_snapshot_at = now + self._time_between_snapshots
-            self._last_image = image
-
-        return self._last_image
+        if width is None and height is not None:
+            # Nest cameras stream in 16:9, nexus only takes a width hint
+            width = height * 16 // 9
+        return await self._device.camera_get_cached_image(self._uuid, width)
+
+    async def handle_async_mjpeg_stream(self, request):
+        """Serve a live MJPEG stream of the camera.
+
+        Every viewer gets the frames of the camera's shared feed, so there is
+        a single upstream download per frame however many are watching.
+        """
+        response = web.StreamResponse()
+        response.content_type = f"multipart/x-mixed-replace;boundary={MJPEG_BOUNDARY}"
+        await response.prepare(request)
+        frames = self._device.camera_frames(self._uuid)
+        try:
+            async for frame in frames:
+                await response.write(
+                    f"--{MJPEG_BOUNDARY}\r\n"
+                    "Content-Type: image/jpeg\r\n"
+                    f"Content-Length: {len(frame)}\r\n\r\n".encode() + frame + b"\r\n"
+                )
+        finally:
+            # Leave the feed right away, it stops once nobody is watching
+            await frames.aclose()
+        return response
@@ -0,0 +1,64 @@
+"""Live camera feeds shared by all of their viewers."""
+import asyncio
+
+from time import monotonic
+
+
+class CameraFeed:
+    """Fetch one camera's frames for as long as anyone is watching it.
+
+    However many viewers iterate over frames(), a single loop calls fetch at
+    most once every interval seconds and hands each new frame to all of them.
+    The loop starts with the first viewer and stops when the last one leaves.
+    fetch is a coroutine function returning the frame, or a false value if it
+    could not be fetched.
+    """
+
+    def __init__(self, fetch, interval):
+        self._fetch = fetch
+        self._interval = interval
+        self._viewers = 0
+        self._task = None
+        self._frame = None
+        # Incremented on every new frame, so viewers can tell what they missed
+        self._frame_count = 0
+        self._new_frame = asyncio.Condition()
+
+    @property
+    def viewers(self):
+        """Return the number of viewers iterating over the feed."""
+        return self._viewers
+
+    async def frames(self):
+        """Yield new frames as they arrive, starting with the latest one.
+
+        Viewers too slow for the feed skip to the latest frame. Close the
+        iterator with aclose() when done, so the loop can stop.
+        """
+        self._viewers += 1
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        try:
+            seen = 0
+            while True:
+                async with self._new_frame:
+                    await self._new_frame.wait_for(lambda: self._frame_count != seen)
+                    seen = self._frame_count
+                    frame = self._frame
+                yield frame
+        finally:
+            self._viewers -= 1
+            if not self._viewers:
+                self._task.cancel()
+                self._task = None
+
+    async def _run(self):
+        while True:
+            started = monotonic()
+            frame = await self._fetch()
+            if frame:
+                async with self._new_frame:
+                    self._frame = frame
+                    self._frame_count += 1
+                    self._new_frame.notify_all()
+            await asyncio.sleep(max(0, self._interval - (monotonic() - started)))
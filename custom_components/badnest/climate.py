@@ -1,5 +1,6 @@
 """Demo platform that offers a fake climate device."""
 from datetime import datetime
+import functools
 import logging
 
 try:
@@ -31,7 +32,7 @@ from homeassistant.const import (
     TEMP_CELSIUS,
 )
 
-from .const import DOMAIN
+from . import async_setup_accounts
 
 NEST_MODE_HEAT_COOL = "range"
 NEST_MODE_ECO = "eco"
@@ -65,13 +66,20 @@ _LOGGER = logging.getLogger(__name__)
 
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """Set up the Nest climate device."""
-    api = hass.data[DOMAIN]["api"]
+    await async_setup_accounts(
+        hass, functools.partial(async_setup_account, async_add_entities)
+    )
+
+
+async def async_setup_account(async_add_entities, account, api):
+    """Set up the thermostats of one Nest account."""
+    await api.async_wait_devices()
 
     thermostats = []
     _LOGGER.info("Adding thermostats")
     for thermostat in api["thermostats"]:
         _LOGGER.info(f"Adding nest thermostat uuid: {thermostat}")
-        thermostats.append(NestClimate(thermostat, api))
+        thermostats.append(NestClimate(thermostat, api, account))
 
     async_add_entities(thermostats)
 
@@ -79,7 +87,7 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
 class NestClimate(ClimateEntity):
     """Representation of a Nest climate entity."""
 
-    def __init__(self, device_id, api):
+    def __init__(self, device_id, api, account=None):
         """Initialize the thermostat."""
         self._name = "Nest Thermostat"
         self._unit_of_measurement = TEMP_CELSIUS
@@ -93,39 +101,42 @@ class NestClimate(ClimateEntity):
         self._operation_list = []
 
         self.device = api
+        self._device_state = api.device_data[device_id]
+        self._account = account
 
-        if (
-            self.device.device_data[device_id]["can_heat"]
-            and self.device.device_data[device_id]["can_cool"]
-        ):
+        if self._device_state.can_heat and self._device_state.can_cool:
             self._operation_list.append(HVAC_MODE_AUTO)
             self._support_flags |= SUPPORT_TARGET_TEMPERATURE_RANGE
 
         # Add supported nest thermostat features
-        if self.device.device_data[device_id]["can_heat"]:
+        if self._device_state.can_heat:
             self._operation_list.append(HVAC_MODE_HEAT)
 
-        if self.device.device_data[device_id]["can_cool"]:
+        if self._device_state.can_cool:
             self._operation_list.append(HVAC_MODE_COOL)
 
         self._operation_list.append(HVAC_MODE_OFF)
 
         # feature of device
-        if self.device.device_data[device_id]["has_fan"]:
+        if self._device_state.has_fan:
             self._support_flags = self._support_flags | SUPPORT_FAN_MODE
 
-        if self.device.device_data[device_id]["target_humidity_enabled"]:
+        if self._device_state.target_humidity_enabled:
             self._support_flags = self._support_flags | SUPPORT_TARGET_HUMIDITY
 
     @property
     def unique_id(self):
         """Return an unique ID."""
+        if self._account:
+            return f"{self._account}_{self.device_id}"
         return self.device_id
 
     @property
     def name(self):
         """Return an friendly name."""
-        return self.device.device_data[self.device_id]["name"]
+        if self._account:
+            return f"{self._account} {self._device_state.name}"
+        return self._device_state.name
 
     @property
     def supported_features(self):
@@ -134,8 +145,8 @@ class NestClimate(ClimateEntity):
 
     @property
     def should_poll(self):
-        """Return the polling state."""
-        return True
+        """Return False, the account's poll refreshes all devices at once."""
+        return False
 
     @property
     def temperature_unit(self):
@@ -145,17 +156,17 @@ class NestClimate(ClimateEntity):
     @property
     def current_temperature(self):
         """Return the current temperature."""
-        return self.device.device_data[self.device_id]["current_temperature"]
+        return self._device_state.current_temperature
 
     @property
     def current_humidity(self):
         """Return the current humidity."""
-        return self.device.device_data[self.device_id]["current_humidity"]
+        return self._device_state.current_humidity
 
     @property
     def target_humidity(self):
         """Return the target humidity."""
-        return self.device.device_data[self.device_id]["target_humidity"]
+        return self._device_state.target_humidity
 
     @property
     def min_humidity(self):
@@ -171,48 +182,45 @@ class NestClimate(ClimateEntity):
     def target_temperature(self):
         """Return the temperature we try to reach."""
         if (
-            self.device.device_data[self.device_id]["mode"] != NEST_MODE_HEAT_COOL
-            and not self.device.device_data[self.device_id]["eco"]
+            self._device_state.mode != NEST_MODE_HEAT_COOL
+            and not self._device_state.eco
         ):
-            return self.device.device_data[self.device_id]["target_temperature"]
+            return self._device_state.target_temperature
         return None
 
     @property
     def target_temperature_high(self):
         """Return the highbound target temperature we try to reach."""
         if (
-            self.device.device_data[self.device_id]["mode"] == NEST_MODE_HEAT_COOL
-            and not self.device.device_data[self.device_id]["eco"]
+            self._device_state.mode == NEST_MODE_HEAT_COOL
+            and not self._device_state.eco
         ):
-            return self.device.device_data[self.device_id]["target_temperature_high"]
+            return self._device_state.target_temperature_high
         return None
 
     @property
     def target_temperature_low(self):
         """Return the lowbound target temperature we try to reach."""
         if (
-            self.device.device_data[self.device_id]["mode"] == NEST_MODE_HEAT_COOL
-            and not self.device.device_data[self.device_id]["eco"]
+            self._device_state.mode == NEST_MODE_HEAT_COOL
+            and not self._device_state.eco
         ):
-            return self.device.device_data[self.device_id]["target_temperature_low"]
+            return self._device_state.target_temperature_low
         return None
 
     @property
     def hvac_action(self):
         """Return current operation ie. heat, cool, idle."""
-        return ACTION_NEST_TO_HASS[self.device.device_data[self.device_id]["action"]]
+        return ACTION_NEST_TO_HASS[self._device_state.action]
 
     @property
     def hvac_mode(self):
         """Return hvac target hvac state."""
-        if (
-            self.device.device_data[self.device_id]["mode"] is None
-            or self.device.device_data[self.device_id]["eco"]
-        ):
+        if self._device_state.mode is None or self._device_state.eco:
             # We assume the first operation in operation list is the main one
             return self._operation_list[0]
 
-        return MODE_NEST_TO_HASS[self.device.device_data[self.device_id]["mode"]]
+        return MODE_NEST_TO_HASS[self._device_state.mode]
 
     @property
     def hvac_modes(self):
@@ -222,7 +230,7 @@ class NestClimate(ClimateEntity):
     @property
     def preset_mode(self):
         """Return current preset mode."""
-        if self.device.device_data[self.device_id]["eco"]:
+        if self._device_state.eco:
             return PRESET_ECO
 
         return PRESET_NONE
@@ -235,9 +243,9 @@ class NestClimate(ClimateEntity):
     @property
     def fan_mode(self):
         """Return whether the fan is on."""
-        if self.device.device_data[self.device_id]["has_fan"]:
+        if self._device_state.has_fan:
             # Return whether the fan is on
-            if self.device.device_data[self.device_id]["fan"]:
+            if self._device_state.fan:
                 return FAN_ON
             else:
                 return FAN_AUTO
@@ -247,28 +255,28 @@ class NestClimate(ClimateEntity):
     @property
     def fan_modes(self):
         """Return the list of available fan modes."""
-        if self.device.device_data[self.device_id]["has_fan"]:
+        if self._device_state.has_fan:
             return self._fan_modes
         return None
 
-    def set_temperature(self, **kwargs):
+    async def async_set_temperature(self, **kwargs):
         """Set new target temperature."""
         temp = None
         target_temp_low = kwargs.get(ATTR_TARGET_TEMP_LOW)
         target_temp_high = kwargs.get(ATTR_TARGET_TEMP_HIGH)
-        if self.device.device_data[self.device_id]["mode"] == NEST_MODE_HEAT_COOL:
+        if self._device_state.mode == NEST_MODE_HEAT_COOL:
             if target_temp_low is not None and target_temp_high is not None:
-                self.device.thermostat_set_temperature(
+                await self.device.thermostat_set_temperature(
                     self.device_id, target_temp_low, target_temp_high,
                 )
         else:
             temp = kwargs.get(ATTR_TEMPERATURE)
             if temp is not None:
-                self.device.thermostat_set_temperature(
+                await self.device.thermostat_set_temperature(
                     self.device_id, temp,
                 )
 
-    def set_humidity(self, humidity):
+    async def async_set_humidity(self, humidity):
         """Set new target humidity."""
         humidity = int(
             round(float(humidity) / ROUND_TARGET_HUMIDITY_TO_NEAREST)
@@ -278,37 +286,47 @@ class NestClimate(ClimateEntity):
             humidity = NEST_HUMIDITY_MIN
         if humidity > NEST_HUMIDITY_MAX:
             humidity = NEST_HUMIDITY_MAX
-        self.device.thermostat_set_target_humidity(
+        await self.device.thermostat_set_target_humidity(
             self.device_id, humidity,
         )
 
-    def set_hvac_mode(self, hvac_mode):
+    async def async_set_hvac_mode(self, hvac_mode):
         """Set operation mode."""
-        self.device.thermostat_set_mode(
+        await self.device.thermostat_set_mode(
             self.device_id, MODE_HASS_TO_NEST[hvac_mode],
         )
 
-    def set_fan_mode(self, fan_mode):
+    async def async_set_fan_mode(self, fan_mode):
         """Turn fan on/off."""
-        if self.device.device_data[self.device_id]["has_fan"]:
+        if self._device_state.has_fan:
             if fan_mode == "on":
-                self.device.thermostat_set_fan(
+                await self.device.thermostat_set_fan(
                     self.device_id, int(datetime.now().timestamp() + 60 * 30),
                 )
             else:
-                self.device.thermostat_set_fan(
+                await self.device.thermostat_set_fan(
                     self.device_id, 0,
                 )
 
-    def set_preset_mode(self, preset_mode):
+    async def async_set_preset_mode(self, preset_mode):
         """Set preset mode."""
         need_eco = preset_mode == PRESET_ECO
 
-        if need_eco != self.device.device_data[self.device_id]["eco"]:
-            self.device.thermostat_set_eco_mode(
+        if need_eco != self._device_state.eco:
+            await self.device.thermostat_set_eco_mode(
                 self.device_id, need_eco,
             )
 
-    def update(self):
+    async def async_added_to_hass(self):
+        """Register for updates of this device's data."""
+        self._remove_listener = self.device.add_update_listener(
+            self.async_schedule_update_ha_state, self.device_id
+        )
+
+    async def async_will_remove_from_hass(self):
+        """Stop receiving live updates."""
+        self._remove_listener()
+
+    async def async_update(self):
         """Updates data"""
-        self.device.update()
+        await self.device.update()
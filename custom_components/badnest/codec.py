@@ -0,0 +1,42 @@
+"""JSON codecs for Nest request and response bodies."""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StdlibCodec:
+    """Encode and decode JSON with the json module."""
+
+    name = "json"
+
+    @staticmethod
+    def dumps(value):
+        """Encode value into compact UTF-8 JSON bytes."""
+        return json.dumps(value, separators=(",", ":")).encode()
+
+    @staticmethod
+    def loads(data):
+        """Decode JSON bytes or text, raising ValueError if they are invalid."""
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    """Encode and decode JSON with orjson, several times faster than json."""
+
+    name = "orjson"
+
+    @staticmethod
+    def dumps(value):
+        return orjson.dumps(value)
+
+    @staticmethod
+    def loads(data):
+        # orjson.JSONDecodeError is a ValueError as well
+        return orjson.loads(data)
+
+
+# The fastest codec available
+JSON_CODEC = StdlibCodec if orjson is None else OrjsonCodec
@@ -4,3 +4,12 @@ CONF_COOKIE = "cookie"
 CONF_USER_ID = "user_id"
 CONF_ACCESS_TOKEN = "access_token"
 CONF_REGION = "region"
+CONF_SUBSCRIBE = "subscribe"
+CONF_SNAPSHOT_INTERVAL = "snapshot_interval"
+CONF_STREAM_INTERVAL = "stream_interval"
+CONF_METRICS = "metrics"
+CONF_REFRESH_INTERVALS = "refresh_intervals"
+CONF_ACCOUNTS = "accounts"
+
+STORAGE_KEY = DOMAIN
+STORAGE_VERSION = 1
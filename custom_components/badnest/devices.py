@@ -0,0 +1,92 @@
+"""State records for the devices of a Nest account."""
+from collections.abc import Mapping
+
+
+class DeviceState(Mapping):
+    """State of one device, with one slot per field.
+
+    Entities read the fields as attributes. For code written against the
+    old per-device dicts a record also reads and writes like one, so
+    device_data[sn]["name"] keeps working. Every field starts out as None.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, fields=()):
+        """Initialize the record, ignoring keys that are not fields.
+
+        Ignoring unknown keys lets state saved by other versions load.
+        """
+        for key in self.__slots__:
+            setattr(self, key, None)
+        for key, value in dict(fields).items():
+            if key in self.__slots__:
+                setattr(self, key, value)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def astuple(self):
+        """Return the field values, for telling whether any of them changed."""
+        return tuple(getattr(self, key) for key in self.__slots__)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class ThermostatState(DeviceState):
+    __slots__ = (
+        "name",
+        "current_temperature",
+        "target_temperature",
+        "target_temperature_high",
+        "target_temperature_low",
+        "hvac_ac_state",
+        "hvac_heater_state",
+        "can_heat",
+        "can_cool",
+        "mode",
+        "action",
+        "has_fan",
+        "fan",
+        "current_humidity",
+        "target_humidity",
+        "target_humidity_enabled",
+        "eco",
+        # Thermostats double as temperature sensors
+        "temperature",
+        "battery_level",
+    )
+
+
+class ProtectState(DeviceState):
+    __slots__ = ("name", "co_status", "smoke_status", "battery_health_state")
+
+
+class TemperatureSensorState(DeviceState):
+    __slots__ = ("name", "temperature", "battery_level")
+
+
+class CameraState(DeviceState):
+    __slots__ = (
+        "name",
+        "is_online",
+        "is_streaming",
+        "battery_voltage",
+        "ac_voltage",
+        "location",
+        "data_tier",
+    )
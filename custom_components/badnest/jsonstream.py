@@ -0,0 +1,136 @@
+"""Incremental decoding of one array inside a JSON document."""
+import codecs
+import json
+
+from json.decoder import WHITESPACE
+
+# Parser states
+_OBJECT = 0  # before the document's opening brace
+_KEY = 1  # before a member name, or the closing brace
+_COLON = 2  # after a member name
+_VALUE = 3  # before a member value
+_MEMBER_END = 4  # after a member value
+_ITEM = 5  # before an item of the array, or its closing bracket
+_ITEM_END = 6  # after an item of the array
+_DONE = 7  # after the document's closing brace
+
+# Characters that can start a number, and that can continue one
+_NUMBER_START = "-0123456789"
+_NUMBER_CHARS = "0123456789.eE+-"
+
+
+class ArrayItemDecoder:
+    """Decode the items of one array of a JSON object as its bytes arrive.
+
+    feed() takes the next chunk of the document and returns the items of the
+    array under key that the chunk completed, so each item can be used and
+    dropped before the rest of the document has been read. Other members of
+    the object are decoded one at a time and thrown away. close() raises
+    ValueError if the document was cut short.
+    """
+
+    def __init__(self, key):
+        self._key = key
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._state = _OBJECT
+        self._member = None
+        # Whether the last member or item was followed by a comma
+        self._comma = False
+
+    def feed(self, data):
+        """Add a chunk of the document and return the items it completed."""
+        self._buffer += self._text.decode(data)
+        items = []
+        pos = self._parse(items)
+        self._buffer = self._buffer[pos:]
+        return items
+
+    def close(self):
+        """Check that the whole document was read."""
+        self._buffer += self._text.decode(b"", final=True)
+        pos = WHITESPACE.match(self._buffer, self._parse([])).end()
+        if self._state != _DONE or pos != len(self._buffer):
+            raise ValueError("Incomplete or invalid JSON document")
+
+    def _parse(self, items):
+        """Advance over the buffer as far as it goes, returning the position."""
+        buffer = self._buffer
+        pos = 0
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                return pos
+            char = buffer[pos]
+            if self._state == _OBJECT:
+                self._expect(char, "{")
+                self._state = _KEY
+                self._comma = False
+                pos += 1
+            elif self._state in (_KEY, _VALUE, _ITEM):
+                if self._state == _KEY and char == "}" and not self._comma:
+                    self._state = _DONE
+                    pos += 1
+                    continue
+                if self._state == _ITEM and char == "]" and not self._comma:
+                    self._state = _MEMBER_END
+                    pos += 1
+                    continue
+                if self._state == _VALUE and self._member == self._key:
+                    self._expect(char, "[")
+                    self._state = _ITEM
+                    self._comma = False
+                    pos += 1
+                    continue
+                value, end = self._decode(buffer, pos)
+                if end is None:
+                    # The value runs on into the next chunk
+                    return pos
+                if self._state == _KEY:
+                    self._member = value
+                    self._state = _COLON
+                elif self._state == _VALUE:
+                    self._state = _MEMBER_END
+                else:
+                    items.append(value)
+                    self._state = _ITEM_END
+                pos = end
+            elif self._state == _COLON:
+                self._expect(char, ":")
+                self._state = _VALUE
+                pos += 1
+            elif self._state in (_MEMBER_END, _ITEM_END):
+                if self._state == _MEMBER_END:
+                    self._expect(char, ",}")
+                    self._state = _KEY if char == "," else _DONE
+                else:
+                    self._expect(char, ",]")
+                    self._state = _ITEM if char == "," else _MEMBER_END
+                self._comma = char == ","
+                pos += 1
+            else:
+                raise ValueError(f"Extra data at {char!r}")
+
+    def _decode(self, buffer, pos):
+        """Decode the value at pos, or return (None, None) if it is incomplete.
+
+        A value is only complete once something follows it, as the end of the
+        buffer may cut a number short. For a number that has to be something
+        that can't continue it: "21." decodes as 21, but may be "21.5" cut
+        after the dot.
+        """
+        try:
+            value, end = self._decoder.raw_decode(buffer, pos)
+        except ValueError:
+            return None, None
+        if end == len(buffer):
+            return None, None
+        if buffer[pos] in _NUMBER_START and buffer[end] in _NUMBER_CHARS:
+            return None, None
+        return value, end
+
+    @staticmethod
+    def _expect(char, expected):
+        if char not in expected:
+            raise ValueError(f"Expected one of {expected!r}, got {char!r}")
@@ -0,0 +1,134 @@
+"""Request metrics for the Nest API client."""
+from bisect import bisect_left
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 180)
+
+
+class EndpointMetrics:
+    """Counters for the requests sent to one logical endpoint."""
+
+    def __init__(self):
+        self.requests = 0
+        # One count per LATENCY_BUCKETS bound plus one for slower requests
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.response_bytes = 0
+        # HTTP status code, or "error" for timeouts and connection errors
+        self.status_codes = {}
+        self.relogins = 0
+
+    def as_dict(self):
+        """Return the counters in a form usable as entity attributes."""
+        buckets = {}
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.latency_counts):
+            total += count
+            buckets[f"le_{bound}"] = total
+        return {
+            "requests": self.requests,
+            "latency_avg": (
+                round(self.latency_sum / self.requests, 3) if self.requests else None
+            ),
+            "latency_buckets": buckets,
+            "response_bytes": self.response_bytes,
+            "status_codes": dict(self.status_codes),
+            "relogins": self.relogins,
+        }
+
+
+class RequestMetrics:
+    """Per-endpoint request counts, latencies, sizes and status codes.
+
+    AsyncNestAPI records every HTTP request it sends here, including retries
+    and the repeat of a request after a 401, under the request's logical
+    endpoint name.
+    """
+
+    def __init__(self):
+        self.endpoints = {}
+
+    def endpoint(self, name):
+        """Return the metrics of an endpoint, creating them on first use."""
+        if name not in self.endpoints:
+            self.endpoints[name] = EndpointMetrics()
+        return self.endpoints[name]
+
+    def record_request(self, name, status, latency, size=0):
+        metrics = self.endpoint(name)
+        metrics.requests += 1
+        metrics.latency_counts[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        metrics.latency_sum += latency
+        metrics.response_bytes += size
+        metrics.status_codes[status] = metrics.status_codes.get(status, 0) + 1
+
+    def record_relogin(self, name):
+        """Count a login forced by a 401 from the endpoint."""
+        self.endpoint(name).relogins += 1
+
+    def prometheus(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        return prometheus({None: self})
+
+
+def _label_value(value):
+    """Escape free text for use as a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus(accounts):
+    """Return the metrics of several accounts in the Prometheus text format.
+
+    accounts maps account names to their RequestMetrics. Samples of a named
+    account carry an account label, those of the unnamed one don't.
+    """
+    series = []
+    for account, metrics in sorted(
+        accounts.items(), key=lambda item: "" if item[0] is None else item[0]
+    ):
+        labels = "" if account is None else f'account="{_label_value(account)}",'
+        for name, endpoint in sorted(metrics.endpoints.items()):
+            series.append((f'{labels}endpoint="{name}"', endpoint))
+
+    lines = [
+        "# HELP badnest_requests_total Requests sent to Nest.",
+        "# TYPE badnest_requests_total counter",
+    ]
+    for labels, metrics in series:
+        for status, count in sorted(
+            metrics.status_codes.items(), key=lambda item: str(item[0])
+        ):
+            lines.append(
+                f'badnest_requests_total{{{labels},status="{status}"}} {count}'
+            )
+    lines += [
+        "# HELP badnest_request_duration_seconds Time taken by Nest requests.",
+        "# TYPE badnest_request_duration_seconds histogram",
+    ]
+    for labels, metrics in series:
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), metrics.latency_counts):
+            total += count
+            lines.append(
+                "badnest_request_duration_seconds_bucket"
+                f'{{{labels},le="{bound}"}} {total}'
+            )
+        lines.append(
+            f"badnest_request_duration_seconds_sum{{{labels}}} {metrics.latency_sum}"
+        )
+        lines.append(
+            f"badnest_request_duration_seconds_count{{{labels}}} {metrics.requests}"
+        )
+    for metric, attribute, description in (
+        ("response_bytes", "response_bytes", "Bytes received from Nest."),
+        ("relogins", "relogins", "Logins forced by a 401 from Nest."),
+    ):
+        lines += [
+            f"# HELP badnest_{metric}_total {description}",
+            f"# TYPE badnest_{metric}_total counter",
+        ]
+        for labels, metrics in series:
+            lines.append(
+                f"badnest_{metric}_total{{{labels}}} {getattr(metrics, attribute)}"
+            )
+    return "\n".join(lines) + "\n"
@@ -1,8 +1,10 @@
+import functools
 import logging
 
 from homeassistant.helpers.entity import Entity
 
-from .const import DOMAIN
+from . import async_setup_accounts
+from .const import DOMAIN, CONF_METRICS
 
 from homeassistant.const import (
     ATTR_BATTERY_LEVEL,
@@ -14,16 +16,35 @@ _LOGGER = logging.getLogger(__name__)
 
 PROTECT_SENSOR_TYPES = ["co_status", "smoke_status", "battery_health_state"]
 
+METRIC_ENDPOINTS = [
+    "issue_token",
+    "issue_jwt",
+    "app_launch",
+    "subscribe",
+    "v5_put",
+    "cameras",
+    "dropcam_camera",
+    "set_properties",
+    "get_image",
+]
+
 
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """Set up the Nest climate device."""
-    api = hass.data[DOMAIN]["api"]
+    await async_setup_accounts(
+        hass, functools.partial(async_setup_account, hass, async_add_entities)
+    )
+
+
+async def async_setup_account(hass, async_add_entities, account, api):
+    """Set up the sensors of one Nest account."""
+    await api.async_wait_devices()
 
     temperature_sensors = []
     _LOGGER.info("Adding temperature sensors")
     for sensor in api["temperature_sensors"]:
         _LOGGER.info(f"Adding nest temp sensor uuid: {sensor}")
-        temperature_sensors.append(NestTemperatureSensor(sensor, api))
+        temperature_sensors.append(NestTemperatureSensor(sensor, api, account))
 
     async_add_entities(temperature_sensors)
 
@@ -32,35 +53,50 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
     for sensor in api["protects"]:
         _LOGGER.info(f"Adding nest protect sensor uuid: {sensor}")
         for sensor_type in PROTECT_SENSOR_TYPES:
-            protect_sensors.append(NestProtectSensor(sensor, sensor_type, api))
+            protect_sensors.append(NestProtectSensor(sensor, sensor_type, api, account))
 
     async_add_entities(protect_sensors)
 
+    if account in hass.data[DOMAIN][CONF_METRICS]:
+        _LOGGER.info("Adding request metrics sensors")
+        async_add_entities(
+            [
+                NestRequestMetricsSensor(endpoint, api, account)
+                for endpoint in METRIC_ENDPOINTS
+            ]
+        )
+
 
 class NestTemperatureSensor(Entity):
     """Implementation of the Nest Temperature Sensor."""
 
-    def __init__(self, device_id, api):
+    def __init__(self, device_id, api, account=None):
         """Initialize the sensor."""
         self._name = "Nest Temperature Sensor"
         self._unit_of_measurement = TEMP_CELSIUS
         self.device_id = device_id
         self.device = api
+        self._device_state = api.device_data[device_id]
+        self._account = account
 
     @property
     def unique_id(self):
         """Return an unique ID."""
+        if self._account:
+            return f"{self._account}_{self.device_id}"
         return self.device_id
 
     @property
     def name(self):
         """Return the name of the sensor."""
-        return self.device.device_data[self.device_id]["name"]
+        if self._account:
+            return f"{self._account} {self._device_state.name}"
+        return self._device_state.name
 
     @property
     def state(self):
         """Return the state of the sensor."""
-        return self.device.device_data[self.device_id]["temperature"]
+        return self._device_state.temperature
 
     @property
     def device_class(self):
@@ -72,43 +108,116 @@ class NestTemperatureSensor(Entity):
         """Return the unit of measurement of this entity, if any."""
         return self._unit_of_measurement
 
-    def update(self):
+    @property
+    def should_poll(self):
+        """Return False, the account's poll refreshes all devices at once."""
+        return False
+
+    async def async_added_to_hass(self):
+        """Register for updates of this device's data."""
+        self._remove_listener = self.device.add_update_listener(
+            self.async_schedule_update_ha_state, self.device_id
+        )
+
+    async def async_will_remove_from_hass(self):
+        """Stop receiving live updates."""
+        self._remove_listener()
+
+    async def async_update(self):
         """Get the latest data from the DHT and updates the states."""
-        self.device.update()
+        await self.device.update()
 
     @property
     def device_state_attributes(self):
         """Return the state attributes."""
-        return {
-            ATTR_BATTERY_LEVEL: self.device.device_data[self.device_id]["battery_level"]
-        }
+        return {ATTR_BATTERY_LEVEL: self._device_state.battery_level}
 
 
 class NestProtectSensor(Entity):
     """Implementation of the Nest Protect sensor."""
 
-    def __init__(self, device_id, sensor_type, api):
+    def __init__(self, device_id, sensor_type, api, account=None):
         """Initialize the sensor."""
         self._name = "Nest Protect Sensor"
         self.device_id = device_id
         self._sensor_type = sensor_type
         self.device = api
+        self._device_state = api.device_data[device_id]
+        self._account = account
 
     @property
     def unique_id(self):
         """Return an unique ID."""
+        if self._account:
+            return f"{self._account}_{self.device_id}_{self._sensor_type}"
         return self.device_id + "_" + self._sensor_type
 
     @property
     def name(self):
         """Return the name of the sensor."""
-        return self.device.device_data[self.device_id]["name"] + f" {self._sensor_type}"
+        if self._account:
+            return f"{self._account} {self._device_state.name} {self._sensor_type}"
+        return self._device_state.name + f" {self._sensor_type}"
 
     @property
     def state(self):
         """Return the state of the sensor."""
-        return self.device.device_data[self.device_id][self._sensor_type]
+        return getattr(self._device_state, self._sensor_type)
+
+    @property
+    def should_poll(self):
+        """Return False, the account's poll refreshes all devices at once."""
+        return False
+
+    async def async_added_to_hass(self):
+        """Register for updates of this device's data."""
+        self._remove_listener = self.device.add_update_listener(
+            self.async_schedule_update_ha_state, self.device_id
+        )
+
+    async def async_will_remove_from_hass(self):
+        """Stop receiving live updates."""
+        self._remove_listener()
 
-    def update(self):
+    async def async_update(self):
         """Get the latest data from the Protect and updates the states."""
-        self.device.update()
+        await self.device.update()
+
+
+class NestRequestMetricsSensor(Entity):
+    """Diagnostic sensor counting the requests sent to one Nest endpoint."""
+
+    def __init__(self, endpoint, api, account=None):
+        """Initialize the sensor."""
+        self._endpoint = endpoint
+        self.device = api
+        self._account = account
+
+    @property
+    def unique_id(self):
+        """Return an unique ID."""
+        if self._account:
+            return f"{self._account}_badnest_requests_{self._endpoint}"
+        return f"badnest_requests_{self._endpoint}"
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        if self._account:
+            return f"{self._account} Nest API {self._endpoint} requests"
+        return f"Nest API {self._endpoint} requests"
+
+    @property
+    def state(self):
+        """Return the number of requests sent so far."""
+        return self.device.metrics.endpoint(self._endpoint).requests
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement of this entity, if any."""
+        return "requests"
+
+    @property
+    def device_state_attributes(self):
+        """Return latency, size, status code and re-login counters."""
+        return self.device.metrics.endpoint(self._endpoint).as_dict()